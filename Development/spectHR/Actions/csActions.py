@@ -62,6 +62,12 @@ def calcPeaks(DataSet, par=None):
 
     # Step 7: Update the dataset's RTopTimes with the time stamps corresponding to the detected peaks
     DS.RTops = pd.DataFrame({'time': (DS.ecg.time.iloc[locs] + correction).tolist(), 'epoch': DS.epoch.iloc[locs]})
+    # Epoch membership also as a bitmask per beat, for vectorized filtering (see Tools/Explode.epoch_masks)
+    if getattr(DS, 'epoch_mask', None) is not None:
+        DS.RTops['epoch_mask'] = DS.epoch_mask[locs]
+    # Keep the per-beat R amplitude and QRS area: they are modulated by breathing (see Tools/Respiration.edr)
+    DS.RTops['amplitude'] = np.asarray(vals)
+    DS.RTops['qrs_area'] = qrs_area(DS.ecg.level.to_numpy(dtype=float), locs, par['fSample'])
     # Step 8: If warrented: classify and label the peaks 
     # Calculate the IBIs
     IBI = np.append(np.diff(DS.RTops['time']), float('nan'))
@@ -70,12 +76,44 @@ def calcPeaks(DataSet, par=None):
     DS.RTops['ID'] = 'N'
     if par['Classify']:
         classify(DS)
+    DS.rtops_changed()  # the columns above were set in place
     # Log the action
     DS.log_action('calcPeaks', par)
     # Step 9: Return the updated dataset and the parameters
     return DS
 
 
+def qrs_area(level, locs, fs, half_width=0.05, baseline=0.2):
+    """
+    Computes the area of the QRS complex around every detected R-top in one vectorized pass.
+
+    The area is the integral of the ECG over +/- `half_width` seconds around the peak, relative
+    to the mean level over +/- `baseline` seconds (which removes baseline wander). All windows
+    are evaluated with one cumulative sum of the signal.
+
+    Args:
+        level (np.ndarray): ECG samples.
+        locs (np.ndarray): Sample indices of the R-tops.
+        fs (float): Sampling frequency (Hz).
+        half_width (float, optional): Half width of the QRS window in seconds. Defaults to 0.05.
+        baseline (float, optional): Half width of the baseline window in seconds. Defaults to 0.2.
+
+    Returns:
+        np.ndarray: QRS area per R-top (signal units * s).
+    """
+    level = np.nan_to_num(level - np.nanmean(level))
+    prefix = np.concatenate(([0.0], np.cumsum(level)))
+
+    def window_sum(half):
+        lo = np.clip(locs - half, 0, len(level))
+        hi = np.clip(locs + half + 1, 0, len(level))
+        return prefix[hi] - prefix[lo], hi - lo
+
+    qrs, n_qrs = window_sum(int(round(half_width * fs)))
+    base, n_base = window_sum(int(round(baseline * fs)))
+    return (qrs - n_qrs * base / n_base) / fs
+
+
 def filterECGData(DataSet, par=None):
     """
     Placeholder function for filtering ECG data, which can be customized.
@@ -226,6 +264,8 @@ def classify(data, par=None):
             if data.RTops.at[i,'ID'] == "S" and data.RTops.at[i + 1,'ID'] == "N" and data.RTops.at[i + 2,'ID'] == "S":
                 data.RTops.at[i,'ID'] = "SNS"  # Short-normal-short sequence
 
+    data.rtops_changed()  # the IDs were set in place
+
     # Count occurrences of each ID
     id_counts = data.RTops['ID'].value_counts()
     for ids, count in id_counts.items():
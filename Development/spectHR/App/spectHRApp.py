@@ -1,12 +1,14 @@
 import spectHR as cs
 from spectHR.Tools.Logger import logger
-from ipywidgets import Tab, Output, VBox
+from ipywidgets import Tab, Output, VBox, HBox
 import ipyvuetify as v
 import pandas as pd
-import pyhrv
+import numpy as np
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
-def HRApp(DataSet):
+def HRApp(DataSet, psd_engine='welch'):
     """
     Creates an interactive Heart Rate Variability (HRV) analysis application using ipywidgets.
     
@@ -18,6 +20,9 @@ def HRApp(DataSet):
     ----------
     DataSet : object
         A spectHRdataset object containing RTop data such as inter-beat intervals (IBIs), epochs, and more. 
+    psd_engine : str, optional
+        Spectral engine of the PSD tab: 'welch' (default), 'lombscargle' or 'burg'
+        (autoregressive, for epochs too short for Welch).
 
     Returns:
     -------
@@ -56,8 +61,96 @@ def HRApp(DataSet):
     App = v.Tabs(v_model=0, children=tab_list + content_list)
     
     # Initialize empty series for PSD and descriptive statistics values
-    DataSet.psd_Values = pd.Series()
+    DataSet.psd_Values = pd.DataFrame()
     DataSet.descriptives_Values = pd.Series()
+
+    # Analyses and saves run in one worker thread, so the notebook stays responsive. Every
+    # analysis works on a snapshot of the dataset (see SpectHRDataset.snapshot), so edits made
+    # in the PreProcessing tab meanwhile do not change the data being analysed.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='HRApp')
+    loop = asyncio.get_event_loop()  # the kernel's event loop
+    pending = {}
+
+    # What every tab shows, as the R-top version (and epoch selection) it was rendered for:
+    # a tab is only rendered again when that changed, so flipping between tabs is instant
+    rendered = {}
+
+    def is_current(output, key):
+        """
+        True if `output` already shows the results for `key`.
+        """
+        return rendered.get(id(output)) == key
+
+    def run_in_background(output, compute, render, key=None):
+        """
+        Runs compute(snapshot) in the worker thread while `output` shows a progress bar, then
+        render(snapshot, result) into `output` on the notebook's event loop (widgets and
+        Matplotlib are not thread-safe). Only the most recent request per output is rendered;
+        once it is, `output` counts as current for `key`.
+        """
+        output.clear_output()
+        with output:
+            display(v.ProgressLinear(indeterminate=True, color='primary'))
+        snapshot = DataSet.snapshot()
+        future = executor.submit(compute, snapshot)
+        pending[id(output)] = future
+        rendered.pop(id(output), None)
+
+        def finish(future):
+            if pending.get(id(output)) is not future:
+                return  # superseded by a newer request
+            output.clear_output()
+            with output:
+                try:
+                    result = future.result()
+                    # Keep the caches that the worker filled on the snapshot
+                    for name in ('spectrogram_cache', 'respiration_cache', 'analysis_cache'):
+                        if name in snapshot.__dict__:
+                            setattr(DataSet, name, getattr(snapshot, name))
+                    render(snapshot, result)
+                    rendered[id(output)] = key
+                except Exception as e:
+                    logger.error(f"Analysis failed: {e}")
+
+        future.add_done_callback(lambda future: loop.call_soon_threadsafe(finish, future))
+
+    def compute_descriptives(snapshot):
+        """
+        Descriptive statistics per epoch, with respiration, baroreflex and PSD values (worker thread).
+        """
+        def statistics():
+            # Compute descriptive statistics grouped by epoch (single vectorized pass)
+            values = cs.descriptives(snapshot, nonlinear=True)
+
+            # Breathing rate, RSA and coherence from the breathing channel, or else from the ECG
+            if getattr(snapshot, 'br', None) is not None or 'amplitude' in snapshot.RTops.columns:
+                values = values.join(cs.respiration(snapshot))
+
+            # Blood pressure and baroreflex sensitivity if there is a blood pressure channel
+            if getattr(snapshot, 'bp', None) is not None:
+                values = values.join(cs.baroreflex(snapshot, engine=psd_engine if psd_engine == 'burg' else 'welch'))
+            return values
+
+        # Recomputed only after R-top edits or a change of the active epochs
+        values = snapshot.cached('descriptives', statistics, psd_engine, snapshot.epochs_version)
+
+        # Merge PSD values if available
+        if hasattr(snapshot, 'psd_Values'):
+            df = snapshot.psd_Values.dropna(how='all')
+            values = values.join(df, how='outer')
+        return values.reset_index()
+
+    def compute_psd(snapshot):
+        """
+        Spectra and band powers of all epochs, and the band-power time course (worker thread).
+        """
+        # Compute the spectra and band powers of all epochs in one batched call (cached until
+        # the R-tops or the active epochs change)
+        result = snapshot.cached('epoch_psd', lambda: cs.epoch_psd(snapshot, engine=psd_engine, nperseg=256, noverlap=128),
+                                 psd_engine, snapshot.epochs_version)
+        # Band powers over time (cached per parameter set on the dataset)
+        cs.spectrogram(snapshot)
+        return result
     
     # Define the callback function for handling tab switches
     def on_tab_change(change):
@@ -71,41 +164,21 @@ def HRApp(DataSet):
             the index of the newly selected tab.
         """
         tab_index = change['new']
-        if tab_index == 1:  # Poincare tab selected
+        if tab_index == 1 and not is_current(poincarePlot, DataSet.rtops_version):  # Poincare tab selected
             with poincarePlot:
                 poincarePlot.clear_output()  # Clear previous content
                 display(cs.poincare(DataSet))  # Display Poincare plot for the dataset
+            # Its own checkboxes toggle the epochs: only new R-tops need a new plot
+            rendered[id(poincarePlot)] = DataSet.rtops_version
 
             
-        if tab_index == 2:  # Descriptives tab selected
-            with descriptives:
-                descriptives.clear_output()  # Clear previous content
-                
-                # Compute descriptive statistics grouped by epoch
-                DataSet.descriptives_Values = cs.explode(DataSet)\
-                    .groupby('epoch')['ibi']\
-                    .agg([\
-                        ('N', len),\
-                        ('mean', 'mean'),\
-                        ('std', 'std'),\
-                        ('min', 'min'),\
-                        ('max', 'max'),\
-                        ('rmssd', lambda x: pyhrv.time_domain.rmssd(x)[0]), \
-                        ('sdnn', lambda x: pyhrv.time_domain.sdnn(x)[0]),\
-                        ('sdsd', cs.Tools.Params.sdsd),\
-                        ('sd1', cs.Tools.Params.sd1),\
-                        ('sd2', cs.Tools.Params.sd2),\
-                        ('sd_ratio', cs.Tools.Params.sd_ratio),\
-                        ('ellipse_area', cs.ellipse_area)\
-                    ])
-                
-                # Merge PSD values if available
-                if hasattr(DataSet, 'psd_Values'):
-                    df = pd.DataFrame(list(DataSet.psd_Values.dropna()))
-                    df['epoch'] = DataSet.psd_Values.dropna().index
-                    pd.set_option('display.precision', 8)  # Set display precision for DataFrame
-                    DataSet.descriptives_Values = pd.merge(DataSet.descriptives_Values, df, on='epoch', how='outer')
-                
+        # The descriptives include the PSD values as last shown on the PSD tab
+        descriptives_key = (DataSet.rtops_version, DataSet.epochs_version, rendered.get(id(psdPlot)))
+        if tab_index == 2 and not is_current(descriptives, descriptives_key):  # Descriptives tab selected
+            def render_descriptives(snapshot, values):
+                DataSet.descriptives_Values = values
+                pd.set_option('display.precision', 8)  # Set display precision for DataFrame
+
                  # Output widget to display the table
                 table_output = Output()
                 with table_output:
@@ -167,30 +240,55 @@ print(combined_data)
                 # Attach click event handler
                 save_button.on_event('click', save_to_csv)
 
-                # Combine the table and the button in a VBox
-                layout = VBox(children=[table_output, save_button])
+                # Upsert the table into the cohort store next to the data
+                def save_to_cohort(widget, event, data):
+                    store = cs.CohortStore(os.path.join(DataSet.datadir, 'cohort.sqlite'))
+                    store.store(DataSet)
+
+                cohort_button = v.Btn(
+                    children=[
+                        v.Icon(left=True, children=["fa-database"]),
+                        "Save to cohort"
+                    ],
+                    class_="ma-2",
+                    color="primary",
+                    outlined=True,
+                )
+                cohort_button.on_event('click', save_to_cohort)
+
+                # Combine the table and the buttons in a VBox
+                layout = VBox(children=[table_output, HBox(children=[save_button, cohort_button])])
                 
                 # Display the VBox
                 display(layout)
                 #display(DataSet.descriptives_Values)  # Display the computed statistics
+
+            run_in_background(descriptives, compute_descriptives, render_descriptives, descriptives_key)
+
+        analysis_key = (DataSet.rtops_version, DataSet.epochs_version)
+        if tab_index == 3 and not is_current(psdPlot, analysis_key):  # PSD tab selected
+            def render_psd(snapshot, result):
+                freqs, psd, DataSet.psd_Values = result
+
+                # Plotting is a separate step
+                for epoch, spectrum in zip(DataSet.psd_Values.index, psd):
+                    if not np.isnan(spectrum).all():
+                        cs.plot_psd(freqs, spectrum, DataSet.psd_Values.loc[epoch], epoch.title())
+
+                # Band powers over time, from the cache filled by the worker
+                cs.plot_spectrogram(snapshot)
+
+            run_in_background(psdPlot, compute_psd, render_psd, analysis_key)
                 
-        if tab_index == 3:  # PSD tab selected
-            with psdPlot:
-                psdPlot.clear_output()  # Clear previous content
-                
-                # Compute PSD values using Welch's method
-                Data = cs.explode(DataSet)
-                DataSet.psd_Values = Data.groupby('epoch')[Data.columns.tolist()]\
-                                         .apply(cs.welch_psd, nperseg=256, noverlap=128)
-                
-        if tab_index == 4:  # Gantt tab selected
+        if tab_index == 4 and not is_current(Gantt, analysis_key):  # Gantt tab selected
             with Gantt:
                 Gantt.clear_output()  # Clear previous content
                 display(cs.gantt(DataSet, labels=True))  # Display Gantt chart visualization
+            rendered[id(Gantt)] = analysis_key
 
         if change['old'] in [1,2]:
-            # Save changes to the dataset after any tab interaction
-            DataSet.save()
+            # Save changes to the dataset after any tab interaction (in the worker thread)
+            executor.submit(DataSet.save)
     
     # Attach the tab change observer to the Tab widget
     App.observe(on_tab_change, 'v_model')
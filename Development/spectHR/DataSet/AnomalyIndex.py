@@ -0,0 +1,165 @@
+import numpy as np
+
+# Beat classes assigned by `classify`, besides 'N' (normal)
+CLASSES = ('L', 'S', 'TL', 'SL', 'SNS')
+
+
+class AnomalyIndex:
+    """
+    Sorted index of the times of all beats that are not labelled 'N', per class.
+
+    The index answers "previous/next anomaly before/after time x" with one `searchsorted`
+    instead of masking the whole RTops table, and finds low-quality segments: stretches
+    where anomalous beats cluster. It is kept up to date by `RTopModel` edits; a new
+    classification (which relabels every beat) builds a new one.
+
+    Attributes:
+        times (np.ndarray): Sorted times of all anomalous beats.
+        by_label (dict): Sorted times per label.
+
+    Methods:
+        insert(time, label), discard(time, label), move(old_time, new_time, label):
+            Incremental updates for an added, removed or moved beat.
+        previous(x, label=None), next(x, label=None):
+            Time of the closest anomaly before or after x.
+        segments(window=10.0, min_count=3):
+            Low-quality segments, as (start, end) rows.
+        previous_segment(x), next_segment(x):
+            The closest low-quality segment starting before or after x.
+    """
+
+    def __init__(self, time, ids):
+        """
+        Builds the index from beat times and labels (sorted once, here).
+
+        Args:
+            time (np.ndarray): Beat times.
+            ids (np.ndarray): Beat labels ('N', 'L', 'S', ...), aligned with time.
+        """
+        time = np.asarray(time, dtype=float)
+        ids = np.asarray(ids, dtype=object)
+        anomalous = ids != 'N'
+        order = np.argsort(time[anomalous], kind='stable')
+        self.times = time[anomalous][order]
+        labels = ids[anomalous][order]
+        self.by_label = {label: self.times[labels == label] for label in set(labels.tolist())}
+        self._segments = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def counts(self):
+        """
+        Number of anomalous beats per label.
+        """
+        return {label: len(times) for label, times in self.by_label.items() if len(times)}
+
+    def insert(self, time, label):
+        """
+        Adds a beat; beats labelled 'N' are ignored.
+        """
+        if label == 'N':
+            return
+        self.times = _insert_sorted(self.times, time)
+        self.by_label[label] = _insert_sorted(self.by_label.get(label, np.empty(0)), time)
+        self._segments.clear()
+
+    def discard(self, time, label):
+        """
+        Removes a beat; beats labelled 'N' (or not in the index) are ignored.
+        """
+        if label == 'N':
+            return
+        self.times = _delete_sorted(self.times, time)
+        if label in self.by_label:
+            self.by_label[label] = _delete_sorted(self.by_label[label], time)
+        self._segments.clear()
+
+    def move(self, old_time, new_time, label):
+        """
+        Moves a beat from old_time to new_time.
+        """
+        self.discard(old_time, label)
+        self.insert(new_time, label)
+
+    def previous(self, x, label=None):
+        """
+        Time of the last anomaly before x.
+
+        Args:
+            x (float): Time in seconds.
+            label (str, optional): Only consider this label. Defaults to any label but 'N'.
+
+        Returns:
+            float: The time, or None if there is none.
+        """
+        times = self._times(label)
+        i = int(np.searchsorted(times, x)) - 1
+        return float(times[i]) if i >= 0 else None
+
+    def next(self, x, label=None):
+        """
+        Time of the first anomaly after x (see `previous`).
+        """
+        times = self._times(label)
+        i = int(np.searchsorted(times, x, side='right'))
+        return float(times[i]) if i < len(times) else None
+
+    def segments(self, window=10.0, min_count=3):
+        """
+        Low-quality segments: stretches with at least `min_count` anomalous beats within
+        `window` seconds. Overlapping stretches are merged into one segment.
+
+        Args:
+            window (float, optional): Window length in seconds. Defaults to 10.0.
+            min_count (int, optional): Anomalies needed within a window. Defaults to 3.
+
+        Returns:
+            np.ndarray: (n, 2) array of segment start and end times, sorted by start.
+        """
+        key = (window, min_count)
+        if key not in self._segments:
+            times, k = self.times, max(int(min_count), 1)
+            # Every run of k consecutive anomalies within the window is a candidate; the
+            # candidates are sorted by start and by end, so they merge where they overlap
+            starts, ends = times[:max(len(times) - k + 1, 0)], times[k - 1:]
+            dense = ends - starts <= window
+            starts, ends = starts[dense], ends[dense]
+            result = np.empty((0, 2))
+            if len(starts):
+                first = np.r_[True, starts[1:] > ends[:-1]]
+                last = np.r_[first[1:], True]
+                result = np.column_stack([starts[first], ends[last]])
+            self._segments[key] = result
+        return self._segments[key]
+
+    def previous_segment(self, x, **kwargs):
+        """
+        The last low-quality segment starting before x, as (start, end), or None.
+        Keyword arguments are passed on to `segments`.
+        """
+        segments = self.segments(**kwargs)
+        i = int(np.searchsorted(segments[:, 0], x)) - 1
+        return tuple(map(float, segments[i])) if i >= 0 else None
+
+    def next_segment(self, x, **kwargs):
+        """
+        The first low-quality segment starting after x, as (start, end), or None.
+        """
+        segments = self.segments(**kwargs)
+        i = int(np.searchsorted(segments[:, 0], x, side='right'))
+        return tuple(map(float, segments[i])) if i < len(segments) else None
+
+    def _times(self, label):
+        return self.times if label is None else self.by_label.get(label, np.empty(0))
+
+
+def _insert_sorted(times, time):
+    return np.insert(times, int(np.searchsorted(times, time)), time)
+
+
+def _delete_sorted(times, time):
+    i = int(np.searchsorted(times, time))
+    if i < len(times) and times[i] == time:
+        times = np.delete(times, i)
+    return times
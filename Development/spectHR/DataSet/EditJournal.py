@@ -0,0 +1,368 @@
+import os
+import struct
+import zlib
+import numpy as np
+from spectHR.Tools.Logger import logger
+from spectHR.Tools.Explode import masks_from_lists, lists_from_masks
+from spectHR.DataSet.AnomalyIndex import CLASSES
+
+# One fixed-size record per edit: 46 bytes. The values of the beat (label, epoch membership,
+# R amplitude and QRS area) are only used by 'restore' records.
+RECORD = np.dtype([('op', 'u1'), ('index', '<i4'), ('old_time', '<f8'), ('new_time', '<f8'),
+                   ('label', 'u1'), ('epoch_mask', '<u8'), ('amplitude', '<f8'), ('qrs_area', '<f8')])
+# Records of journal files written before 'restore' existed: 21 bytes
+RECORD_V1 = np.dtype([('op', 'u1'), ('index', '<i4'), ('old_time', '<f8'), ('new_time', '<f8')])
+# File header: magic, number of beats and CRC-32 of the beat times of the base the records apply to
+HEADER = struct.Struct('<4sII')
+MAGIC = b'RTJ2'
+RECORD_FORMATS = {MAGIC: RECORD, b'RTJ1': RECORD_V1}
+OPS = {'add': 1, 'move': 2, 'remove': 3, 'restore': 4}
+OP_NAMES = {code: name for name, code in OPS.items()}
+# Beat labels as stored in a record; any other label is stored as NO_LABEL
+LABELS = ('N',) + CLASSES
+NO_LABEL = 255
+
+
+def times_crc(time):
+    """
+    CRC-32 of an array of beat times, identifying the base state of a journal.
+    """
+    return zlib.crc32(np.ascontiguousarray(time, dtype='<f8').tobytes()) & 0xffffffff
+
+
+class EditJournal:
+    """
+    Undo/redo journal of manual R-top edits.
+
+    Every edit made through an `RTopModel` is recorded as a compact (op, index, old_time,
+    new_time) record: 'add' (new_time at position index), 'move' (the beat at index from
+    old_time to new_time) or 'remove' (the beat at index, which was at old_time). Undo and
+    redo walk this history and apply the inverse or the original edit.
+
+    When attached to a file, every applied edit (including the inverse edits of an undo) is
+    also appended to it as one 46-byte record, so the edits since the last save survive a
+    kernel restart without re-pickling the dataset. An add is written as a 'restore' record,
+    which also holds the label, epoch membership, R amplitude and QRS area of the beat: a
+    removed beat that is brought back by an undo is then replayed with its own values, not
+    as a new unlabelled beat outside every epoch. The file header holds a checksum of the
+    R-tops it starts from; the records are only replayed onto a dataset with those R-tops.
+
+    A journal is copied with its dataset (`copy.deepcopy`, as the actions do), so the copy
+    keeps the history and goes on writing to the file. Before every write the file is checked
+    to still be the one this journal wrote (same header and length): once another copy has
+    written to it or renewed it, this journal stops writing, and its dataset is compacted at
+    the next save (see `is_current`).
+
+    Attributes:
+        history (list): (op, index, old_time, new_time) tuples, oldest first.
+        position (int): Number of history entries that are applied (the rest can be redone).
+        path (str): The journal file, or None when not attached.
+        n_records (int): Number of records in the journal file.
+        base (tuple): Number of beats and CRC-32 of the R-tops the file starts from.
+        epoch_names (list): Epoch-name registry used to store epoch lists as bitmasks.
+
+    Methods:
+        record(op, index, old_time, new_time, row=None):
+            Adds an edit to the history (called by RTopModel).
+        undo(model), redo(model):
+            Reverts or re-applies one edit on the model.
+        attach(path, time):
+            Opens a journal file and returns the records still to be replayed.
+        replay(model, records):
+            Applies records from a journal file to the model.
+        start(path, time):
+            Starts an empty journal file for a freshly saved state.
+        is_current():
+            Whether the file is attached and holds exactly the records of this journal.
+        clear():
+            Forgets the history and stops writing (the R-tops were replaced wholesale).
+    """
+
+    def __init__(self, epoch_names=None):
+        """
+        Args:
+            epoch_names (list, optional): The epoch-name registry of the dataset (see
+                `create_epoch_series`), for R-tops that hold epoch lists but no epoch_mask.
+        """
+        self.epoch_names = list(epoch_names) if epoch_names is not None else []
+        self.history = []
+        self.position = 0
+        self.path = None
+        self.n_records = 0
+        self.base = None
+        self._rows = {}  # full rows of added/removed beats, by history entry (this session only)
+        self._muted = False
+        self._replaying = False
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.history)
+
+    def record(self, op, index, old_time, new_time, row=None):
+        """
+        Adds an edit to the history, dropping any edits that were undone, and appends it
+        to the journal file.
+
+        Args:
+            op (str): 'add', 'move' or 'remove'.
+            index (int): Position of the beat before the edit ('add': its new position).
+            old_time (float): Time before the edit (NaN for 'add').
+            new_time (float): Time after the edit (NaN for 'remove').
+            row (dict, optional): All values of an added or removed beat, to restore it.
+        """
+        if self._muted:
+            return
+        del self.history[self.position:]
+        self._rows = {k: v for k, v in self._rows.items() if k < self.position}
+        if row is not None:
+            self._rows[self.position] = row
+        self.history.append((op, int(index), float(old_time), float(new_time)))
+        self.position += 1
+        self._write(op, index, old_time, new_time, row)
+
+    def undo(self, model):
+        """
+        Reverts the last applied edit.
+
+        Args:
+            model (RTopModel): The R-tops the edit was made on.
+
+        Returns:
+            bool: False if there was nothing to undo.
+        """
+        with model.lock:
+            if not self.can_undo():
+                return False
+            self.position -= 1
+            op, index, old_time, new_time = self.history[self.position]
+            if op == 'add':
+                self._apply(model, 'remove', index, new_time, np.nan)
+            elif op == 'move':
+                self._apply(model, 'move', model.nearest(new_time), new_time, old_time)
+            elif op == 'remove':
+                self._apply(model, 'add', index, np.nan, old_time, self._rows.get(self.position))
+        return True
+
+    def redo(self, model):
+        """
+        Re-applies the last undone edit.
+
+        Args:
+            model (RTopModel): The R-tops the edit was made on.
+
+        Returns:
+            bool: False if there was nothing to redo.
+        """
+        with model.lock:
+            if not self.can_redo():
+                return False
+            op, index, old_time, new_time = self.history[self.position]
+            self._apply(model, op, index, old_time, new_time, self._rows.get(self.position))
+            self.position += 1
+        return True
+
+    def attach(self, path, time):
+        """
+        Attaches the journal to a file. If the file starts from the given R-tops, its records
+        are returned for `replay`; otherwise a new file is started.
+
+        Args:
+            path (str): Path of the journal file.
+            time (np.ndarray): Sorted beat times of the saved R-tops.
+
+        Returns:
+            np.ndarray: The records (dtype RECORD) to replay; empty if there are none.
+        """
+        records = np.empty(0, dtype=RECORD)
+        record_format = RECORD
+        try:
+            with open(path, 'rb') as file:
+                magic, n, crc = HEADER.unpack(file.read(HEADER.size))
+                record_format = RECORD_FORMATS.get(magic)
+                if record_format is not None and n == len(time) and crc == times_crc(time):
+                    data = file.read()
+                    records = np.frombuffer(data[:len(data) - len(data) % record_format.itemsize], dtype=record_format)
+                else:
+                    logger.warning(f'Edit journal {path} does not match the saved R-tops; starting a new one')
+        except (FileNotFoundError, struct.error):
+            pass
+
+        if len(records) == 0:
+            self.start(path, time)
+        elif record_format is not RECORD:
+            # An older file: convert its records and rewrite it in the current format
+            converted = np.zeros(len(records), dtype=RECORD)
+            for field in record_format.names:
+                converted[field] = records[field]
+            records = converted
+            self.start(path, time)
+            self._append(records)
+        else:
+            self.path = path
+            self.base = (len(time), times_crc(time))
+            # Drop a record that was only partly written, so new records stay aligned
+            self._truncate(len(records))
+        return records
+
+    def replay(self, model, records):
+        """
+        Applies the records of a journal file to the model, adding them to the history (so
+        they can be undone) without writing them again.
+
+        Args:
+            model (RTopModel): The R-tops as saved, that the records start from.
+            records (np.ndarray): Records from `attach`.
+        """
+        self._replaying = True
+        try:
+            for n, record in enumerate(records):
+                op, index, new_time = OP_NAMES.get(int(record['op'])), int(record['index']), float(record['new_time'])
+                if op is None or (op in ('move', 'remove') and not 0 <= index < len(model)):
+                    logger.warning(f'Edit journal {self.path} is damaged after {n} records; ignoring the rest')
+                    self._truncate(n)
+                    break
+                if op == 'add':
+                    model.add(new_time)
+                elif op == 'restore':
+                    model.add(new_time, **self._values(record))
+                elif op == 'move':
+                    model.move(index, new_time)
+                elif op == 'remove':
+                    model.remove(index)
+        finally:
+            self._replaying = False
+        logger.info(f'Replayed {len(records)} R-top edits from {self.path}')
+
+    def start(self, path, time):
+        """
+        Starts an empty journal file for the given (just saved) R-tops. The in-memory history
+        is kept, so edits made before a save can still be undone.
+
+        Args:
+            path (str): Path of the journal file.
+            time (np.ndarray): Sorted beat times of the saved R-tops.
+        """
+        try:
+            with open(path, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, len(time), times_crc(time)))
+            self.path = path
+            self.n_records = 0
+            self.base = (len(time), times_crc(time))
+        except OSError as e:
+            logger.error(f'Failed to start edit journal: {e}')
+            self.path = None
+
+    def is_current(self):
+        """
+        Whether the journal is attached to a file that holds exactly its records: the same
+        header and length as this journal wrote. Another copy of the dataset may have written
+        to the file, or renewed it on a save, since.
+
+        Returns:
+            bool: False when not attached or when the file changed.
+        """
+        if self.path is None:
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                header = HEADER.unpack(file.read(HEADER.size))
+                size = os.fstat(file.fileno()).st_size
+        except (OSError, struct.error):
+            return False
+        return header == (MAGIC,) + tuple(self.base) and size == HEADER.size + self.n_records * RECORD.itemsize
+
+    def clear(self):
+        """
+        Forgets the history and stops writing to the file. Used when the R-tops are replaced
+        wholesale (e.g. a new peak detection), which the records cannot describe; the file
+        is renewed at the next save.
+        """
+        self.history = []
+        self.position = 0
+        self._rows = {}
+        self.path = None
+        self.n_records = 0
+
+    def _apply(self, model, op, index, old_time, new_time, row=None):
+        """
+        Applies one edit to the model without adding it to the history, and journals it.
+        """
+        self._muted = True
+        try:
+            if op == 'add':
+                i = model.add(new_time, **{k: v for k, v in (row or {}).items() if k != 'time'})
+                row = model.row(i)  # as inserted, for the 'restore' record
+            elif op == 'move':
+                model.move(index, new_time)
+            elif op == 'remove':
+                model.remove(index)
+        finally:
+            self._muted = False
+        self._write(op, index, old_time, new_time, row)
+
+    def _truncate(self, n_records):
+        """
+        Cuts the journal file after its first n_records records.
+        """
+        try:
+            os.truncate(self.path, HEADER.size + n_records * RECORD.itemsize)
+            self.n_records = n_records
+        except OSError as e:
+            logger.error(f'Failed to truncate edit journal: {e}')
+
+    def _write(self, op, index, old_time, new_time, row=None):
+        """
+        Appends one record to the journal file; an add with the values of the beat (row)
+        becomes a 'restore' record.
+        """
+        if self.path is None or self._replaying:
+            return
+        record = np.zeros(1, dtype=RECORD)
+        record['op'], record['index'] = OPS[op], index
+        record['old_time'], record['new_time'] = old_time, new_time
+        record['amplitude'] = record['qrs_area'] = np.nan
+        if op == 'add' and row is not None:
+            record['op'] = OPS['restore']
+            label = row.get('ID', 'N')
+            record['label'] = LABELS.index(label) if label in LABELS else NO_LABEL
+            if 'epoch_mask' in row:
+                record['epoch_mask'] = row['epoch_mask']
+            elif self.epoch_names:
+                record['epoch_mask'] = masks_from_lists([row.get('epoch')], self.epoch_names)[0]
+            for column in ('amplitude', 'qrs_area'):
+                record[column] = row.get(column, np.nan)
+        self._append(record)
+
+    def _append(self, records):
+        """
+        Appends records to the journal file, unless the file changed since this journal
+        last wrote it (see `is_current`): the edits are then saved by the next compaction.
+        """
+        if not self.is_current():
+            logger.warning(f'Edit journal {self.path} was changed by another copy of the dataset; '
+                           'the edits are saved at the next save')
+            self.path = None
+            return
+        try:
+            with open(self.path, 'ab') as file:
+                file.write(records.tobytes())
+            self.n_records += len(records)
+        except OSError as e:
+            logger.error(f'Failed to write edit journal: {e}')
+
+    def _values(self, record):
+        """
+        The values of a beat from a 'restore' record, as keyword arguments for `RTopModel.add`.
+        """
+        label = int(record['label'])
+        values = {
+            'ID': LABELS[label] if label < len(LABELS) else None,
+            'epoch_mask': np.uint64(record['epoch_mask']),
+            'amplitude': float(record['amplitude']),
+            'qrs_area': float(record['qrs_area']),
+        }
+        if self.epoch_names:
+            values['epoch'] = lists_from_masks([record['epoch_mask']], self.epoch_names)[0]
+        return values
@@ -0,0 +1,250 @@
+import threading
+import numpy as np
+import pandas as pd
+from spectHR.DataSet.AnomalyIndex import AnomalyIndex
+
+
+class RTopModel:
+    """
+    Edit model of the R-tops of a dataset, backed by sorted NumPy arrays.
+
+    Every column of the RTops DataFrame is kept as one array, sorted by time. A beat is
+    located with `searchsorted`, inserted or deleted in place, and only the IBIs next to
+    the edit are recomputed, so an edit does not depend on pandas indexing, re-sorting or
+    a full IBI recalculation. The DataFrame is rebuilt (`to_frame`) only when it is read.
+
+    Edits made through `add`, `move` and `remove` are recorded in the `journal`, if any
+    (see `EditJournal`), which provides undo and redo, and reported to `on_edit`.
+
+    Attributes:
+        columns (list): Column names, in the order of the original DataFrame.
+        dirty (bool): True when the arrays hold edits that are not in a DataFrame yet.
+        journal (EditJournal): Receives every edit, or None.
+        on_edit (callable): Called without arguments after every edit, or None.
+        anomalies (AnomalyIndex): Sorted times of the beats not labelled 'N', built on first
+            use and kept up to date by the edits.
+        lock (threading.RLock): Held during every edit and `to_frame`, so another thread
+            never sees a half-applied edit.
+
+    Methods:
+        nearest(x):
+            Position of the beat closest to time x.
+        window(x_min, x_max):
+            Positions of the beats within [x_min, x_max], as a slice.
+        add(x, **values):
+            Inserts a beat at time x.
+        move(i, x):
+            Moves beat i to time x.
+        remove(i):
+            Deletes beat i.
+        to_frame():
+            The R-tops as a DataFrame.
+    """
+
+    def __init__(self, frame, journal=None, lock=None, on_edit=None):
+        """
+        Builds the model from an RTops DataFrame (sorted by time once, here).
+
+        Args:
+            frame (pd.DataFrame): R-tops with at least a 'time' column.
+            journal (EditJournal, optional): Journal to record the edits in. Defaults to None.
+            lock (threading.RLock, optional): Lock shared with the dataset. Defaults to a new lock.
+            on_edit (callable, optional): Called after every edit, e.g. to invalidate cached
+                results. Defaults to None.
+        """
+        frame = frame.sort_values('time', kind='stable')
+        self.columns = list(frame.columns)
+        self.arrays = {}
+        for column in self.columns:
+            values = frame[column].to_numpy(copy=True)
+            if values.dtype.kind in 'ib':
+                values = values.astype(float)  # leaves room for NaN in inserted beats
+            self.arrays[column] = values
+        self.arrays['time'] = self.arrays['time'].astype(float)
+        self.dirty = False
+        self.journal = journal
+        self.lock = lock if lock is not None else threading.RLock()
+        self.on_edit = on_edit
+        self._anomalies = None
+
+    def __len__(self):
+        return len(self.arrays['time'])
+
+    def __getitem__(self, column):
+        """
+        The (sorted) array of a column; treat it as read-only.
+        """
+        return self.arrays[column]
+
+    @property
+    def anomalies(self):
+        """
+        Index of the anomalous (non-'N') beats, see `AnomalyIndex`.
+        """
+        with self.lock:
+            if self._anomalies is None:
+                self._anomalies = AnomalyIndex(self.arrays['time'], self._labels())
+            return self._anomalies
+
+    def nearest(self, x):
+        """
+        Position of the beat closest to time x.
+
+        Args:
+            x (float): Time in seconds.
+
+        Returns:
+            int: Position of the beat, or None if there are no beats.
+        """
+        time = self.arrays['time']
+        if len(time) == 0:
+            return None
+        i = int(np.searchsorted(time, x))
+        if i == len(time) or (i > 0 and x - time[i - 1] <= time[i] - x):
+            i -= 1
+        return i
+
+    def window(self, x_min, x_max):
+        """
+        Positions of the beats within [x_min, x_max].
+
+        Returns:
+            slice: Use it to index the column arrays.
+        """
+        time = self.arrays['time']
+        return slice(int(np.searchsorted(time, x_min, side='left')),
+                     int(np.searchsorted(time, x_max, side='right')))
+
+    def add(self, x, **values):
+        """
+        Inserts a beat at time x.
+
+        Args:
+            x (float): Time of the new beat.
+            **values: Values of other columns. Missing columns get ID 'N' or NaN/None.
+
+        Returns:
+            int: Position of the new beat.
+        """
+        values = {'ID': 'N', **values, 'time': x}
+        with self.lock:
+            i = int(np.searchsorted(self.arrays['time'], x))
+            self._insert(i, values)
+            self._patch_ibi(i - 1, i)
+            if self._anomalies is not None:
+                self._anomalies.insert(x, self._labels()[i])
+            self._record('add', i, np.nan, x, self.row(i))
+        return i
+
+    def move(self, i, x):
+        """
+        Moves beat i to time x. The beat keeps its other values; if it passes a neighbour
+        it is re-inserted at its new position.
+
+        Args:
+            i (int): Position of the beat.
+            x (float): New time.
+
+        Returns:
+            int: New position of the beat.
+        """
+        with self.lock:
+            time = self.arrays['time']
+            old_i, old_x = i, time[i]
+            if (i == 0 or time[i - 1] <= x) and (i == len(time) - 1 or x <= time[i + 1]):
+                time[i] = x
+                self.dirty = True
+            else:
+                row = self.row(i)
+                self._delete(i)
+                row['time'] = x
+                i = int(np.searchsorted(self.arrays['time'], x))
+                self._insert(i, row)
+            self._patch_ibi(i - 1, i)
+            if self._anomalies is not None:
+                self._anomalies.move(old_x, x, self._labels()[i])
+            self._record('move', old_i, old_x, x)
+        return i
+
+    def remove(self, i):
+        """
+        Deletes beat i.
+
+        Args:
+            i (int): Position of the beat.
+        """
+        with self.lock:
+            row = self.row(i)
+            self._delete(i)
+            if self._anomalies is not None:
+                self._anomalies.discard(row['time'], row.get('ID', 'N'))
+            self._record('remove', i, row['time'], np.nan, row)
+
+    def row(self, i):
+        """
+        All values of beat i, as a dict.
+        """
+        return {column: array[i] for column, array in self.arrays.items()}
+
+    def to_frame(self):
+        """
+        The R-tops as a DataFrame, in time order with a fresh index.
+        """
+        with self.lock:
+            return pd.DataFrame({column: self.arrays[column].copy() for column in self.columns})
+
+    def _insert(self, i, values):
+        """
+        Inserts one row at position i; columns missing from `values` get NaN (numeric), 0
+        (bitmasks) or None.
+        """
+        for column, array in self.arrays.items():
+            # Unsigned columns are bitmasks (epoch_mask): a new beat has no bits set
+            blank = np.nan if array.dtype.kind in 'fc' else 0 if array.dtype.kind == 'u' else None
+            value = values.get(column, blank)
+            if array.dtype.kind == 'O':
+                # np.insert would unpack list values (the epoch labels of a beat)
+                result = np.empty(len(array) + 1, dtype=object)
+                result[:i], result[i + 1:] = array[:i], array[i:]
+                result[i] = value
+            else:
+                result = np.insert(array, i, value)
+            self.arrays[column] = result
+        self.dirty = True
+
+    def _delete(self, i):
+        """
+        Deletes the row at position i and patches the IBI of the beat before it.
+        """
+        for column, array in self.arrays.items():
+            self.arrays[column] = np.delete(array, i)
+        self.dirty = True
+        self._patch_ibi(i - 1)
+
+    def _labels(self):
+        """
+        The beat labels, or 'N' for all beats if there is no ID column.
+        """
+        if 'ID' in self.arrays:
+            return self.arrays['ID']
+        return np.full(len(self), 'N', dtype=object)
+
+    def _record(self, op, index, old_time, new_time, row=None):
+        """
+        Passes an edit on to the journal and to `on_edit`.
+        """
+        if self.journal is not None:
+            self.journal.record(op, index, old_time, new_time, row)
+        if self.on_edit is not None:
+            self.on_edit()
+
+    def _patch_ibi(self, *positions):
+        """
+        Recomputes the IBI (time to the next beat) of the given beats only.
+        """
+        if 'ibi' not in self.arrays:
+            return
+        time, ibi = self.arrays['time'], self.arrays['ibi']
+        for i in positions:
+            if 0 <= i < len(time):
+                ibi[i] = time[i + 1] - time[i] if i + 1 < len(time) else np.nan
@@ -1,13 +1,36 @@
 import pandas as pd
 import numpy as np
-import pyxdf
 import os
 from pathlib import Path
 import pickle
+import copy
+import threading
+import itertools
+import zlib
 
 from datetime import datetime
 from spectHR.Tools.Logger import logger
-from spectHR.Tools.Webdav import copyWebdav
+from spectHR.DataSet.RTopModel import RTopModel
+from spectHR.DataSet.EditJournal import EditJournal
+from spectHR.Tools.Explode import MAX_EPOCHS, epoch_bit, lists_from_masks
+
+# Attributes stored in the raw pickle: they only change when the recording is (re)loaded or filtered
+RAW_ATTRIBUTES = ('ecg', 'br', 'bp', 'events', 'epoch', 'epoch_mask', 'epoch_names', 'unique_epochs', 'starttime')
+# Attributes that describe where this dataset lives; set by __init__, never persisted
+LOCAL_ATTRIBUTES = ('datadir', 'filename', 'pkl_filename', 'file_path', 'pkl_path', 'rtops_path', 'state_path', 'journal_path')
+# Rewrite the R-tops base once the journal holds this many edits
+COMPACT_AFTER = 4096
+# Attributes that only live for this session: never pickled by save. The caches are keyed on
+# `rtops_version`, which never matches after a restart
+SESSION_ATTRIBUTES = ('analysis_cache', 'spectrogram_cache', 'respiration_cache', '_rtops_frame_changed')
+
+# R-top versions are (session, counter) pairs: unique within this process, and never equal
+# to a version pickled by an earlier session, whose cached results would otherwise look valid
+_VERSION_SESSION = os.urandom(4).hex()
+_version_counter = itertools.count(1)
+
+def _new_version():
+    return (_VERSION_SESSION, next(_version_counter))
 
 class TimeSeries:
     """
@@ -17,6 +40,8 @@ class TimeSeries:
         time (pd.Series): Timestamps of the time series.
         level (pd.Series): Values corresponding to each timestamp.
         srate (float): Sampling rate, calculated if not provided.
+        pyramid (MinMaxPyramid): Multi-resolution min/max view of the signal, built lazily
+            (not pickled).
 
     Methods:
         slicetime(time_min, time_max):
@@ -34,12 +59,64 @@ class TimeSeries:
             y (iterable): Level values corresponding to each time value.
             srate (float, optional): Sampling rate. If not provided, it is calculated automatically.
         """
+        self._pyramid = None
         self.time = pd.Series(x)
         self.level = pd.Series(y)
 
         # Automatically calculate sampling rate if not provided
         self.srate = srate if srate is not None else round(1.0 / self.time.diff().mean())
 
+    @property
+    def time(self):
+        return self._time
+
+    @time.setter
+    def time(self, value):
+        self._time = value
+        self._pyramid = None  # the min/max pyramid no longer matches the data
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        self._level = value
+        self._pyramid = None
+
+    @property
+    def pyramid(self):
+        """
+        Min/max level-of-detail pyramid of the signal, built on first use (see
+        `spectHR.Tools.Decimate.MinMaxPyramid`); assigning `time` or `level` discards it.
+        It is not pickled: it holds a second copy of the signal (about 100 MB for ten hours
+        of ECG), while rebuilding it takes a fraction of a second, once per session.
+        """
+        if self._pyramid is None:
+            from spectHR.Tools.Decimate import MinMaxPyramid
+            self._pyramid = MinMaxPyramid(self.time.to_numpy(dtype=float), self.level.to_numpy(dtype=float))
+        return self._pyramid
+
+    def __getstate__(self):
+        """
+        Pickles (and deep-copies) the TimeSeries without its pyramid.
+        """
+        state = self.__dict__.copy()
+        state['_pyramid'] = None
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled TimeSeries, including those pickled before `time` and `level`
+        became properties.
+        """
+        state = dict(state)
+        for name in ('time', 'level'):
+            if name in state:
+                state['_' + name] = state.pop(name)
+        state.setdefault('_pyramid', None)
+        self.__dict__.update(state)
+
     def slicetime(self, time_min, time_max):
         """
         Returns a subset of the TimeSeries between specified time bounds.
@@ -77,6 +154,16 @@ class SpectHRDataset:
         ecg (TimeSeries): The ECG data as a TimeSeries object.
         br (TimeSeries): The breathing data as a TimeSeries object.
         events (pd.DataFrame): A DataFrame containing event timestamps and labels.
+        epoch_names (list): The epoch-name registry: bit i of an epoch mask is epoch_names[i].
+        epoch_mask (np.ndarray): Epoch membership of every ECG sample, as a uint64 bitmask.
+        RTops (pd.DataFrame): The detected R-tops (time, epoch, ibi, ID, ...).
+        rtop_model (RTopModel): Sorted-array edit model of the R-tops, for interactive edits.
+        journal (EditJournal): Undo/redo history of the R-top edits, appended to a file next
+            to the pickle so that edits since the last save survive a restart.
+        lock (threading.RLock): Serializes R-top edits, snapshots and saves across threads.
+        rtops_version (tuple): Changes with every change of the R-tops.
+        epochs_version (tuple): Fingerprint of the active epochs.
+        analysis_cache (dict): Results cached by `cached`, for this session only.
         history (list): A list of actions performed on the dataset.
         par (dict): Parameters associated with various actions.
         starttime (float): The start time of the dataset.
@@ -86,6 +173,8 @@ class SpectHRDataset:
             Loads data from an XDF file and initializes the dataset.
         log_action(action_name, params):
             Logs an action with its parameters into the dataset history.
+        cached(name, compute, *params):
+            Result of compute(), reused while the R-tops and params stay the same.
     """
     def __init__(self, filename, ecg_index=None, br_index=None, event_index=None, par=None, reset = False, use_webdav = False, flip = False):
         """
@@ -98,6 +187,7 @@ class SpectHRDataset:
             event_index (int, optional): Index of the event stream in the XDF file. Defaults to None.
             par (dict, optional): Initial parameters for the dataset. Defaults to None.
         """
+        self._rtop_model = None
         self.ecg = None
         self.br = None
         self.bp = None
@@ -120,9 +210,14 @@ class SpectHRDataset:
             os.makedirs(self.datadir + '\\cache')
             
         self.pkl_path = os.path.join(self.datadir + '\\cache', self.pkl_filename)
+        cache_base = os.path.splitext(self.pkl_path)[0]
+        self.rtops_path = cache_base + '.rtops.pkl'
+        self.state_path = cache_base + '.state.pkl'
+        self.journal_path = cache_base + '.journal'
 
         if use_webdav:
             if not Path(self.file_path).exists():
+                from spectHR.Tools.Webdav import copyWebdav
                 copyWebdav(self.file_path)
                 
         extension = os.path.splitext(filename)[1][1:]
@@ -135,6 +230,7 @@ class SpectHRDataset:
         if Path(self.pkl_path).exists() and not reset:
             logger.info(f"Loading dataset from pickle: {self.pkl_path}")
             self.load_from_pickle()
+            self.open_journal()
         elif Path(self.file_path).exists():
             logger.info(f"Loading dataset from XDF: {self.file_path}")
             self.loadData(self.file_path, ecg_index, br_index, event_index, flip=flip)
@@ -142,29 +238,301 @@ class SpectHRDataset:
         else:
             logger.error(f"File {self.file_path} was not found")
 
-    def save(self):
+    @property
+    def RTops(self):
+        """
+        The R-tops as a DataFrame. After edits through `rtop_model` the frame is rebuilt
+        from the model here, and the model is released: the caller may change the frame,
+        so the next edit starts a new model from it.
+        """
+        with self.lock:
+            model = self.__dict__.get('_rtop_model')
+            if model is not None:
+                if model.dirty:
+                    self.__dict__['_RTops'] = model.to_frame()
+                self._rtop_model = None
+            try:
+                return self.__dict__['_RTops']
+            except KeyError:
+                raise AttributeError("'SpectHRDataset' object has no attribute 'RTops'") from None
+
+    @RTops.setter
+    def RTops(self, value):
+        with self.lock:
+            self.__dict__['_RTops'] = value
+            self._rtop_model = None
+            self._new_rtops_version()
+            # The journal cannot describe a wholesale replacement: it restarts at the next save
+            if self.__dict__.get('_journal') is not None:
+                self._journal.clear()
+
+    @property
+    def rtop_model(self):
+        """
+        Sorted-array edit model of the R-tops (see `RTopModel`), or None without R-tops.
+        Hold on to it only while editing: reading `RTops` releases it.
+        """
+        with self.lock:
+            if self.__dict__.get('_rtop_model') is None and '_RTops' in self.__dict__:
+                self._rtop_model = RTopModel(self.__dict__['_RTops'], journal=self.journal, lock=self.lock,
+                                             on_edit=self._new_rtops_version)
+            return self.__dict__.get('_rtop_model')
+
+    @property
+    def rtops_version(self):
+        """
+        Token that changes with every change of the R-tops: an assignment to `RTops`, an edit,
+        undo or redo through `rtop_model`, or a call to `rtops_changed`. Results computed from
+        the R-tops can be cached against it; compare versions for equality only.
+        """
+        version = self.__dict__.get('_rtops_version')
+        if version is None:
+            version = self.__dict__.setdefault('_rtops_version', _new_version())
+        return version
+
+    def rtops_changed(self):
+        """
+        Gives the R-tops a new `rtops_version`. Call it after changing the RTops frame in place
+        (e.g. `RTops.at[i, 'ID'] = ...`); assignments and model edits do this themselves.
+
+        The journal cannot describe such a change, so the next `save` rewrites the R-tops.
+        """
+        with self.lock:
+            self._rtops_frame_changed = True
+            self._new_rtops_version()
+
+    def _new_rtops_version(self):
+        self._rtops_version = _new_version()
+
+    @property
+    def epochs_version(self):
+        """
+        Fingerprint of the active epochs (see `explode`): which epochs are shown and analysed.
+        """
+        active = getattr(self, 'active_epochs', None)
+        return tuple(sorted(active.items())) if isinstance(active, dict) else None
+
+    def cached(self, name, compute, *params):
         """
-        Saves the current state of the dataset as a pickle file.
+        Result of compute(), kept in `analysis_cache` under `name` and reused as long as the
+        R-tops (`rtops_version`) and params are unchanged. Pass `epochs_version` among the
+        params when the result depends on the active epochs.
+
+        Args:
+            name (str): Name of the result.
+            compute (callable): Computes the result, without arguments.
+            *params: Further values the result depends on (hashable).
+
+        Returns:
+            The (cached) result of compute().
+        """
+        key = (self.rtops_version, params)
+        cache = self.__dict__.setdefault('analysis_cache', {})
+        entry = cache.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        result = compute()
+        cache[name] = (key, result)
+        return result
+
+    @property
+    def lock(self):
+        """
+        Re-entrant lock that guards the R-tops and the journal when analyses and saves run
+        in a worker thread (see `snapshot`). It is not pickled or copied.
+        """
+        lock = self.__dict__.get('_lock')
+        if lock is None:
+            # setdefault is atomic, so two threads cannot end up with different locks
+            lock = self.__dict__.setdefault('_lock', threading.RLock())
+        return lock
+
+    def snapshot(self):
+        """
+        A shallow copy of the dataset for analysis in a worker thread. It shares the raw
+        data, parameters and caches, but has its own R-tops frame as of now, so edits made
+        meanwhile through `rtop_model` do not change the data being analysed.
+
+        Returns:
+            SpectHRDataset: The copy.
+        """
+        with self.lock:
+            snapshot = copy.copy(self)
+            # Without pending model edits the copy still shares the live frame: give it its
+            # own, so an in-place change on either side cannot show up in the other
+            frame = self.__dict__.get('_RTops')
+            if frame is not None and snapshot.__dict__.get('_RTops') is frame:
+                snapshot.__dict__['_RTops'] = frame.copy()
+            # Epochs toggled meanwhile (Poincaré checkboxes) must not change the snapshot either
+            if isinstance(getattr(self, 'active_epochs', None), dict):
+                snapshot.active_epochs = dict(self.active_epochs)
+            # The snapshot is not edited: it must not write to the journal file of the dataset
+            snapshot._journal = None
+            return snapshot
+
+    @property
+    def journal(self):
+        """
+        Undo/redo journal of the R-top edits (see `EditJournal`). A deep copy (as made by the
+        actions) takes a copy of the journal along, with its history, that goes on writing to
+        the journal file; `save` does not pickle it, and a `snapshot` has none.
+        """
+        if self.__dict__.get('_journal') is None:
+            # The same registry as `epoch_masks`, for R-tops that only hold epoch lists
+            names = getattr(self, 'epoch_names', None)
+            if names is None:
+                names = sorted(getattr(self, 'unique_epochs', None) or ())
+            self._journal = EditJournal(epoch_names=names)
+        return self._journal
+
+    def open_journal(self):
+        """
+        Attaches the edit journal to its file and replays the R-top edits made since the
+        pickle was saved.
+        """
+        time = self._saved_rtop_times()
+        records = self.journal.attach(self.journal_path, time)
+        if len(records):
+            self.journal.replay(self.rtop_model, records)
+
+    def __getstate__(self):
+        """
+        Pickles (and deep-copies) the R-tops as a DataFrame, without the edit model. The
+        journal goes along, so a copy made by an action keeps journaling to the same file.
+        """
+        with self.lock:
+            state = self.__dict__.copy()
+            state.pop('_lock', None)
+            model = state.pop('_rtop_model', None)
+            if model is not None and model.dirty:
+                state['_RTops'] = model.to_frame()
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled dataset, including those pickled before `RTops` became a property.
+        """
+        state = dict(state)
+        if 'RTops' in state:
+            state['_RTops'] = state.pop('RTops')
+        state['_rtop_model'] = None
+        state.setdefault('_journal', None)
+        state.pop('_lock', None)  # a new lock is made on first use
+        self.__dict__.update(state)
+
+    def save(self, compact=False):
+        """
+        Saves the dataset in parts, so that a save after some edits takes milliseconds:
+
+        - the raw channels and events (`pkl_path`), only when they changed (see `raw_fingerprint`);
+        - the R-tops (`rtops_path`), only on compaction: when the edit journal is not attached
+          (e.g. after a new peak detection), was changed by another copy of the dataset, or
+          holds more than COMPACT_AFTER edits, and after an in-place change of the frame (see
+          `rtops_changed`). Otherwise the R-top edits are already on disk in the journal (see
+          `EditJournal`);
+        - everything else, such as parameters, history and analysis results (`state_path`).
+
+        Args:
+            compact (bool, optional): Rewrite all parts and start an empty journal. Defaults to False.
         """
         try:
-            with open(self.pkl_path, "wb") as pkl_file:
-                pickle.dump(self, pkl_file)
-            logger.info(f"Dataset saved as pickle: {self.pkl_path}")
+            # The R-tops and the journal may be edited from the notebook while this runs in
+            # a worker thread: take them, and compact them, under the lock
+            with self.lock:
+                state = {name: value for name, value in self.__dict__.items() if name not in ('_journal', '_rtop_model', '_lock')}
+                journal = self.journal
+                frame_changed = self.__dict__.get('_rtops_frame_changed', False)
+                if compact or frame_changed or not journal.is_current() or journal.n_records > COMPACT_AFTER or not Path(self.rtops_path).exists():
+                    self._dump(self.rtops_path, self.__getstate__().get('_RTops'))
+                    self._rtops_frame_changed = False
+                    # The R-tops file now holds all edits: continue with an empty journal file
+                    journal.start(self.journal_path, self._saved_rtop_times())
+
+            fingerprint = self.raw_fingerprint()
+            if compact or fingerprint != state.get('_raw_fingerprint') or not Path(self.pkl_path).exists():
+                self._dump(self.pkl_path, {name: state.get(name) for name in RAW_ATTRIBUTES})
+                self._raw_fingerprint = state['_raw_fingerprint'] = fingerprint
+                logger.info(f"Raw data saved as pickle: {self.pkl_path}")
+
+            skip = RAW_ATTRIBUTES + LOCAL_ATTRIBUTES + SESSION_ATTRIBUTES + ('_RTops',)
+            self._dump(self.state_path, {name: value for name, value in state.items() if name not in skip})
+            logger.info(f"Dataset saved: {self.state_path}")
         except Exception as e:
             logger.error(f"Failed to save pickle file: {e}")
 
+    @staticmethod
+    def _dump(path, obj):
+        """
+        Pickles obj to path via a temporary file, so a failed save leaves the old file intact.
+        """
+        with open(path + '.tmp', "wb") as pkl_file:
+            pickle.dump(obj, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def raw_fingerprint(self):
+        """
+        Cheap fingerprint of the raw channels and events, used by `save` to skip rewriting
+        them. Per channel it covers the length, the sampling rate, the last sample and a
+        CRC-32 of about 4096 evenly spaced samples, so it costs microseconds even for long
+        recordings. Use `save(compact=True)` after a change that it might miss.
+
+        Returns:
+            int: The fingerprint.
+        """
+        crc = 0
+        for name in ('ecg', 'br', 'bp'):
+            series = self.__dict__.get(name)
+            if series is None:
+                crc = zlib.crc32(b'None', crc)
+                continue
+            time = series.time.to_numpy(dtype=float)
+            level = series.level.to_numpy(dtype=float)
+            step = max(len(level) // 4096, 1)
+            crc = zlib.crc32(repr((len(level), series.srate)).encode(), crc)
+            for values in (time[::step], level[::step], time[-1:], level[-1:]):
+                crc = zlib.crc32(np.ascontiguousarray(values).tobytes(), crc)
+        events = self.__dict__.get('events')
+        if events is not None:
+            crc = zlib.crc32(pickle.dumps(events), crc)
+        return crc
+
+    def _saved_rtop_times(self):
+        """
+        Sorted beat times of the R-tops as they are pickled (empty without R-tops).
+        """
+        model = self.__dict__.get('_rtop_model')
+        if model is not None:
+            return model['time']
+        if '_RTops' in self.__dict__:
+            return np.sort(self.__dict__['_RTops']['time'].to_numpy(dtype=float))
+        return np.empty(0)
+
     def load_from_pickle(self):
         """
-        Loads the dataset from a pickle file.
+        Loads the dataset from its pickles: the raw data, the R-tops and the state (see
+        `save`). A pickle of the whole dataset, as written by earlier versions, also works.
         """
         try:
             with open(self.pkl_path, "rb") as pkl_file:
                 data = pickle.load(pkl_file)
-            self.__dict__.update(data.__dict__)
+            if isinstance(data, SpectHRDataset):
+                self.__dict__.update(data.__dict__)
+            else:
+                self.__dict__.update(data)
+                if Path(self.rtops_path).exists():
+                    with open(self.rtops_path, "rb") as pkl_file:
+                        rtops = pickle.load(pkl_file)
+                    if rtops is not None:
+                        self.__dict__['_RTops'] = rtops
+                if Path(self.state_path).exists():
+                    with open(self.state_path, "rb") as pkl_file:
+                        self.__dict__.update(pickle.load(pkl_file))
+                    if self.__dict__.get('_raw_fingerprint') != self.raw_fingerprint():
+                        logger.warning("The saved state does not match the raw data it was saved with")
             logger.info("Dataset loaded successfully from pickle")
         except Exception as e:
             logger.error(f"Failed to load pickle file: {e}")
-            
+
     def loadData(self, filename, ecg_index=None, br_index=None, bp_index=None, event_index=None, flip = 'auto'):
         """
         Loads data from an XDF file into the dataset.
@@ -175,6 +543,7 @@ class SpectHRDataset:
             br_index (int, optional): Index of the breathing stream in the XDF file. Defaults to None.
             event_index (int, optional): Index of the event stream in the XDF file. Defaults to None.
         """
+        import pyxdf
         rawdata, _ = pyxdf.load_xdf(filename)
 
         # Identify ECG stream automatically if not provided: 
@@ -238,6 +607,7 @@ class SpectHRDataset:
             self.events = pd.concat(eventlist, ignore_index=True)
             self.create_epoch_series()
             
+    @staticmethod
     def log_error(message):
         logger.error(message)
 
@@ -246,6 +616,10 @@ class SpectHRDataset:
         """
         Creates an 'epoch' series within the dataset to map each time point in the ECG
         to a corresponding epoch(s) based on event labels ('start' and 'end').
+
+        Membership is built as a bitmask per sample (`epoch_mask`), with bit i standing for
+        `epoch_names[i]` (the epoch-name registry, in order of first appearance); the epoch
+        lists are derived from the masks.
     
         Returns:
             pd.Series: A series with epoch labels (lists) for each time index in the ECG and RTopTimes.
@@ -254,8 +628,9 @@ class SpectHRDataset:
             self.log_error('No events available for epoch generation')
             return
     
-        # Initialize the epoch series as a series of lists
-        self.epoch = pd.Series(index=self.ecg.time.index, dtype="object").map(lambda x: [])
+        time = self.ecg.time.to_numpy()
+        mask = np.zeros(len(time), dtype=np.uint64)
+        names = []
     
         labels = self.events['label'].str.lower()
         start_indices = self.events[labels.str.startswith('start')].index
@@ -277,20 +652,33 @@ class SpectHRDataset:
                 # No matching 'end', use the next 'start' or end of data
                 next_start_idx = start_indices[start_indices.get_loc(start_idx) + 1] if start_idx + 1 < len(start_indices) else None
                 end_time = self.events['time'][next_start_idx] if next_start_idx else self.ecg.time.iloc[-1]
+
+            if not epoch_name:
+                continue  # a start without a name is not an epoch
+            if epoch_name not in names:
+                if len(names) == MAX_EPOCHS:
+                    self.log_error(f'More than {MAX_EPOCHS} epochs: {epoch_name} is ignored')
+                    continue
+                names.append(epoch_name)
     
-            # Assign epoch label to the time series (ecg and RTopTimes)
-            for idx in self.epoch.loc[(self.ecg.time >= start_time) & (self.ecg.time <= end_time)].index:
-                self.epoch.at[idx].append(epoch_name)
-                
+            # Assign the epoch to the time series (ecg and RTopTimes)
+            mask[(time >= start_time) & (time <= end_time)] |= epoch_bit(names.index(epoch_name))
+
+        self.epoch_names = names
+        self.epoch_mask = mask
+        self.epoch = pd.Series(lists_from_masks(mask, names), index=self.ecg.time.index, dtype="object")
         self.unique_epochs = self.get_unique_epochs()
 
 
     def get_unique_epochs(self):
         """
-        Returns a set of unique epoch names from the_epoch series.
-        """        # Flatten all lists into one and find unique values
+        Returns a set of unique epoch names, from the epoch-name registry or (for datasets
+        made before it existed) the epoch series.
+        """
+        if getattr(self, 'epoch_names', None) is not None:
+            return set(self.epoch_names)
+        # Flatten all lists into one and find unique values
         all_epochs = [epoch for sublist in self.epoch.dropna() for epoch in sublist]
-        logger.info(all_epochs[31111])
         unique_epochs = set(all_epochs)
         unique_epochs.discard("")
         return unique_epochs
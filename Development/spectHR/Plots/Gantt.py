@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import copy
+import pandas as pd
 from spectHR.Tools.Logger import logger
+from spectHR.Tools.Explode import epoch_masks, visible_mask, epoch_bit
 
 def gantt(dataset, labels=True):
     """
@@ -12,7 +13,8 @@ def gantt(dataset, labels=True):
         dataset (object): A dataset containing R-top information and epochs. 
                           Must have 'RTops' DataFrame and optionally 'active_epochs'.
                           - 'RTops' is expected to include:
-                              - 'epoch' (list of epoch names)
+                              - 'epoch_mask' (epoch bitmask, see `epoch_masks`) or
+                                'epoch' (list of epoch names)
                               - 'time' (float or int representing time)
         labels (bool, optional): If True, displays start and end time annotations on the chart. 
                                  Defaults to False.
@@ -24,40 +26,31 @@ def gantt(dataset, labels=True):
         - If 'active_epochs' exists and is a dictionary, only the visible epochs will be plotted.
         - If 'active_epochs' does not exist, all unique epochs in the dataset will be plotted.
         - The Gantt chart uses a colormap to assign unique colors to each epoch.
+        - The epoch spans are cached on the dataset until the R-tops or the visible epochs change.
     """
     
-    # Deep copy RTops to avoid modifying the original dataset
-    RTops = copy.deepcopy(dataset.RTops)
-    
-    # Filter epochs to keep only those marked as visible
-    if hasattr(dataset, 'active_epochs') and isinstance(dataset.active_epochs, dict):
-        # Use 'active_epochs' to filter visible epochs
-        visible_epochs = {epoch: visible for epoch, visible in dataset.active_epochs.items() if visible}
+    masks, names = epoch_masks(dataset)
+    visible = visible_mask(dataset, names)
+    logger.info(f'Visible epochs: {[name for i, name in enumerate(names) if visible & epoch_bit(i)]}')
+
+    def epoch_spans():
+        time = dataset.RTops["time"].to_numpy(dtype=float)
+        spans = []
+        # Calculate start and end times for each visible epoch, from the R-tops that belong to it
+        for i, name in enumerate(names):
+            members = time[(masks & visible & epoch_bit(i)) != 0]
+            if len(members):
+                spans.append((name, members.min(), members.max()))
+        epochs_gantt = pd.DataFrame(spans, columns=["filtered_epoch", "start", "end"])
+
+        # Sort epochs by start time (descending)
+        return epochs_gantt.sort_values(by="start", ascending=False).reset_index(drop=True)
+
+    # The spans only change with the R-tops or the visible epochs
+    if hasattr(dataset, 'cached'):
+        epochs_gantt = dataset.cached('gantt_spans', epoch_spans, dataset.epochs_version)
     else:
-        # If 'active_epochs' is not defined, assume all epochs are visible
-        visible_epochs = {epoch: True for epoch in dataset.unique_epochs}
-    
-    logger.info(f'Visible epochs: {list(visible_epochs.keys())}')
-    
-    # Filter the RTops DataFrame: Keep rows containing at least one visible epoch
-    RTops["filtered_epoch"] = RTops["epoch"].apply(
-        lambda x: [e for e in x if e in visible_epochs] if x is not None else []
-    )
-    
-    RTops = RTops[RTops["filtered_epoch"].str.len() > 0]  # Remove rows with no visible epochs
-    
-    # Flatten the filtered epochs list for easier plotting
-    exploded = RTops.explode("filtered_epoch")
-    
-    # Calculate start and end times for each epoch
-    epochs_gantt = (
-        exploded.groupby("filtered_epoch")
-        .agg(start=("time", "min"), end=("time", "max"))
-        .reset_index()
-    )
-    
-    # Sort epochs by start time (descending)
-    epochs_gantt = epochs_gantt.sort_values(by="start", ascending=False).reset_index(drop=True)
+        epochs_gantt = epoch_spans()
     
     # Extract relevant columns for plotting
     epoch_names = epochs_gantt["filtered_epoch"]
@@ -7,6 +7,7 @@ from matplotlib.patches import Ellipse
 from ipywidgets import HBox, VBox, Checkbox, Output, Layout
 from spectHR.Tools.Params import *
 from spectHR.Tools.Logger import logger
+from spectHR.Tools.Explode import epoch_masks, epoch_bit
 
 def poincare(dataset):
     """
@@ -37,9 +38,10 @@ def poincare(dataset):
     """
 
     # Step 1: Preprocess the dataset
-    # Create a deep copy of the RTops DataFrame to avoid modifying the original data
-    df = dataset.RTops.dropna(subset=['epoch'])  # Drop rows with missing 'epoch'
-    df = df[df['epoch'].apply(lambda x: len(x) > 0)]
+    # Keep the R-tops that belong to any epoch (epoch membership as bitmasks)
+    RTops = dataset.RTops
+    masks, names = epoch_masks(dataset, RTops)
+    df = RTops[masks != 0]
 
     # Validate the DataFrame structure
     required_columns = {'ibi', 'epoch', 'time'}
@@ -61,13 +63,18 @@ def poincare(dataset):
     if not hasattr(dataset, 'active_epochs'):
         dataset.active_epochs = {epoch: True for epoch in dataset.unique_epochs}
 
-    filtered_by_epoch = {}
     # Step 2: create the sets
-    for unique_epoch in dataset.unique_epochs:
-        # Create a mask for the current epoch
-        mask = [ unique_epoch in sublist if sublist is not None else False for sublist in dataset.RTops.epoch ]    
-        # Subset dataset.RTops for the current epoch
-        filtered_by_epoch[unique_epoch] = dataset.RTops[mask]
+    def epoch_positions():
+        # One bit test per epoch over all R-tops
+        return {name: np.flatnonzero(masks & epoch_bit(i)) for i, name in enumerate(names)}
+
+    # Row positions per epoch only change with the R-tops: reuse them while those are unchanged
+    if hasattr(dataset, 'cached'):
+        positions = dataset.cached('poincare_positions', epoch_positions)
+    else:
+        positions = epoch_positions()
+    # Subset dataset.RTops for every epoch
+    filtered_by_epoch = {epoch: RTops.iloc[rows] for epoch, rows in positions.items()}
 
     # `filtered_by_epoch` now contains the filtered data for each unique epoch
     def on_hover(sel):
@@ -0,0 +1,52 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from spectHR.Tools.Explode import epoch_spans
+from spectHR.Tools.Spectrogram import spectrogram
+
+
+def plot_spectrogram(DataSet, logscale=False, **kwargs):
+    """
+    Plots the LF and HF power and the LF/HF ratio of the recording over time.
+
+    The time course comes from the (cached) `spectHR.Tools.Spectrogram.spectrogram`, so
+    redrawing is cheap. The visible epochs are shaded in the background of both panels.
+
+    Args:
+        DataSet: A SpectHRDataset with RTops and epoch information.
+        logscale (bool, optional): Plot the band powers on a log scale. Defaults to False.
+        **kwargs: Passed on to `spectrogram` (fs, nperseg, noverlap, nfft, window).
+
+    Returns:
+        pd.DataFrame: The plotted band-power time course.
+    """
+    course = spectrogram(DataSet, **kwargs)
+
+    fig, (ax_power, ax_ratio) = plt.subplots(2, 1, figsize=(15, 6), sharex=True)
+    ax_power.plot(course['time'], course['LF Power'], color='green', linewidth=1, label='LF (0.04-0.15 Hz)')
+    ax_power.plot(course['time'], course['HF Power'], color='red', linewidth=1, label='HF (0.15-0.4 Hz)')
+    ax_ratio.plot(course['time'], course['LF/HF Ratio'], color='black', linewidth=1, label='LF/HF Ratio')
+
+    # Shade the epochs
+    spans = epoch_spans(DataSet)
+    colors = plt.cm.tab20(np.linspace(0, 1, max(len(spans), 1)))
+    for color, (epoch, span) in zip(colors, spans.iterrows()):
+        for ax in (ax_power, ax_ratio):
+            ax.axvspan(span['start'], span['end'], color=color, alpha=0.15)
+        ax_power.text(span['start'], 1, epoch, transform=ax_power.get_xaxis_transform(),
+                      fontsize=8, va='bottom')
+
+    ax_power.set_title('Band power over time', fontsize=14, pad=20)
+    ax_power.set_ylabel('Power [$s^2$]', fontsize=12)
+    ax_ratio.set_ylabel('LF/HF', fontsize=12)
+    ax_ratio.set_xlabel('Time [$s$]', fontsize=12)
+    if logscale:
+        ax_power.set_yscale('log')
+
+    for ax in (ax_power, ax_ratio):
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.legend(loc='upper right')
+
+    plt.tight_layout()
+    plt.show()
+    return course
@@ -4,8 +4,9 @@ import matplotlib.pyplot as plt
 from scipy.signal import welch
 from scipy.interpolate import interp1d
 from spectHR.Tools.Logger import logger
+from spectHR.Tools.Spectrum import BANDS, band_powers, burg_psd, lombscargle_psd
 
-def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256, noverlap=128, interp_kind = 'linear', window='hamming'):
+def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256, noverlap=128, interp_kind = 'linear', window='hamming', engine='welch', plot=True, max_order=16):
     """
     Analyzes the frequency domain of an Inter-Beat Interval (IBI) series using Welch's PSD method
     and visualizes the spectral power in VLF, LF, and HF bands.
@@ -15,8 +16,13 @@ def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256,
     VLF (0.003–0.04 Hz), LF (0.04–0.15 Hz), and HF (0.15–0.4 Hz). The results are plotted, highlighting
     these bands in different colors, and key measures are labeled on the plot.
 
-    An alternative to this approuch would be the use of the  Lomb-Scargle periodogram:
-    https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.lombscargle.html#scipy.signal.lombscargle
+    With engine='lombscargle' the Lomb-Scargle periodogram is used instead: it is computed
+    directly from the uneven R-top times, without the interpolation step (see
+    `spectHR.Tools.Spectrum.lombscargle_psd`), on the same frequency grid as Welch.
+
+    With engine='burg' an autoregressive model is fitted with Burg's method (order chosen by
+    AIC, see `spectHR.Tools.Spectrum.burg_psd`). It has no minimum segment length, so it also
+    gives band powers for epochs shorter than `nperseg` samples.
 
     Parameters:
     -----------
@@ -36,6 +42,17 @@ def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256,
         
     logscale: plot the y-axis on a log scale, defaults to False
 
+    engine : str, optional
+        'welch' (default), 'lombscargle' or 'burg'.
+
+    max_order : int, optional
+        Highest AR model order considered by the 'burg' engine (default: 16).
+
+    plot : Boolean, optional
+        Draw the spectrum with `plot_psd`. Set to False when only the numbers are needed.
+        For all epochs at once, use the batched `spectHR.Tools.Spectrum.epoch_psd` instead.
+        Default: True
+
     Returns:
     --------
     spectral_measures : dict
@@ -69,65 +86,85 @@ def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256,
     except AttributeError:
         titlestring = "Whole Interval"
         
-    # 1. Interpolate IBI values onto a uniform time grid
-    # Use .iloc for Pandas Series positional indexing
-    time_uniform = np.arange(ibi_times.iloc[0], ibi_times.iloc[-1], 1/fs)  # Regular time grid at fs Hz
-    if (interpolate):
-        # Linear interpolation of IBI values to match the uniform grid
-        interp_func = interp1d(ibi_times, ibi_values, kind=interp_kind, fill_value='extrapolate')
-        ibi_resampled = interp_func(time_uniform)
+    if engine == 'lombscargle':
+        # Lomb-Scargle works on the uneven R-top times directly: no resampling step.
+        # The grid matches the Welch grid below (nfft=2**12), without the DC bin.
+        valid = np.isfinite(np.asarray(ibi_values, dtype=float))
+        freqs = np.arange(1, 2**11 + 1) * fs / 2**12
+        psd = lombscargle_psd(np.asarray(ibi_times)[valid], np.asarray(ibi_values)[valid], [0], freqs)[0]
+        if np.isnan(psd).all():
+            return
+    elif engine == 'burg':
+        # Burg AR spectrum of the resampled series, on the Welch grid (nfft=2**12)
+        valid = np.isfinite(np.asarray(ibi_values, dtype=float))
+        freqs = np.fft.rfftfreq(2**12, 1/fs)
+        psd = burg_psd(np.asarray(ibi_times)[valid], np.asarray(ibi_values)[valid], [0], freqs, fs, max_order)[0][0]
+        if np.isnan(psd).all():
+            return
     else:
-        ibi_resampled = ibi_values
+        # 1. Interpolate IBI values onto a uniform time grid
+        # Use .iloc for Pandas Series positional indexing
+        time_uniform = np.arange(ibi_times.iloc[0], ibi_times.iloc[-1], 1/fs)  # Regular time grid at fs Hz
+        if (interpolate):
+            # Linear interpolation of IBI values to match the uniform grid
+            interp_func = interp1d(ibi_times, ibi_values, kind=interp_kind, fill_value='extrapolate')
+            ibi_resampled = interp_func(time_uniform)
+        else:
+            ibi_resampled = ibi_values
+            
+        # 2. Compute the Power Spectral Density (PSD) using Welch's method
+        # Welch's method parameters:
+        # - nperseg: Segment size (256 samples at fs=4 Hz -> 64-second segments)
+        # - noverlap: 50% overlap between segments (128 samples)
+        # - window: Hamming window to minimize spectral leakage
+        # if a ValueError occurs (usually the epoch is too small for a calculation using the default 
+        # parameters) the function returns empty. This will lead to the wanted 'NaN'values in the descriptives
+        ibi_resampled = ibi_resampled-np.mean(ibi_resampled)
         
-    # 2. Compute the Power Spectral Density (PSD) using Welch's method
-    # Welch's method parameters:
-    # - nperseg: Segment size (256 samples at fs=4 Hz -> 64-second segments)
-    # - noverlap: 50% overlap between segments (128 samples)
-    # - window: Hamming window to minimize spectral leakage
-    # if a ValueError occurs (usually the epoch is too small for a calculation using the default 
-    # parameters) the function returns empty. This will lead to the wanted 'NaN'values in the descriptives
-    ibi_resampled = ibi_resampled-np.mean(ibi_resampled)
-    
-    try:
-        freqs, psd = welch(ibi_resampled, fs=fs, scaling='density', nfft=2**12, nperseg=nperseg, noverlap=noverlap, window=window)
-    except ValueError:
-        return
+        try:
+            freqs, psd = welch(ibi_resampled, fs=fs, scaling='density', nfft=2**12, nperseg=nperseg, noverlap=noverlap, window=window)
+        except ValueError:
+            return
         
-    # 3. Define frequency bands of interest for HRV analysis
-    vlf_band = (0.003, 0.04)  # Very Low Frequency (VLF)
-    lf_band = (0.04, 0.15)    # Low Frequency (LF)
-    hf_band = (0.15, 0.4)     # High Frequency (HF)
-
-    # Helper function to compute power in a specified frequency range using numerical integration
-    def band_power(frequencies, power_spectrum, band):
-        """
-        Computes the power within a specific frequency band using the trapezoidal rule.
-
-        Parameters:
-        - frequencies: array of frequency values.
-        - power_spectrum: array of PSD values corresponding to the frequencies.
-        - band: tuple (f_low, f_high) defining the frequency range.
-
-        Returns:
-        - Power within the specified band.
-        """
-        idx = np.logical_and(frequencies >= band[0], frequencies <= band[1])
-        return np.trapz(power_spectrum[idx], frequencies[idx])  # Integrate PSD over the band
-
-    # 4. Calculate power in each frequency band
-    vlf_power = band_power(freqs, psd, vlf_band)
-    lf_power = band_power(freqs, psd, lf_band)
-    hf_power = band_power(freqs, psd, hf_band)
-    lf_hf_ratio = lf_power / hf_power  # LF/HF Ratio (sympathovagal balance)
-
-    # 5. Store spectral measures in a dictionary
-    spectral_measures = {
-        'VLF Power': vlf_power,
-        'LF Power': lf_power,
-        'HF Power': hf_power,
-        'LF/HF Ratio': lf_hf_ratio
-    }
-    
+    # 3. Calculate the power in the VLF, LF and HF bands and the LF/HF ratio
+    spectral_measures = {name: float(value) for name, value in band_powers(freqs, psd).items()}
+
+    # 4. Optionally draw the spectrum
+    if plot:
+        plot_psd(freqs, psd, spectral_measures, titlestring, logscale)
+
+    return spectral_measures
+
+
+def plot_psd(freqs, psd, spectral_measures, titlestring="Whole Interval", logscale=False):
+    """
+    Plots a power spectral density with the VLF, LF and HF bands highlighted.
+
+    This is the plotting half of `welch_psd`; the spectrum and band powers can come from
+    any engine, e.g. a row of the batched `spectHR.Tools.Spectrum.epoch_psd` result.
+
+    Parameters:
+    -----------
+    freqs : np.ndarray
+        Frequency values (Hz).
+    psd : np.ndarray
+        PSD values (s²/Hz) corresponding to the frequencies.
+    spectral_measures : dict or pd.Series
+        'VLF Power', 'LF Power', 'HF Power' and 'LF/HF Ratio' shown in the legend.
+    titlestring : str, optional
+        Name of the epoch, used in the legend. Default: "Whole Interval"
+    logscale : Boolean, optional
+        Plot the y-axis on a log scale. Default: False
+    """
+    vlf_band = BANDS['VLF']  # Very Low Frequency (VLF)
+    lf_band = BANDS['LF']    # Low Frequency (LF)
+    hf_band = BANDS['HF']    # High Frequency (HF)
+
+    vlf_power = spectral_measures['VLF Power']
+    lf_power = spectral_measures['LF Power']
+    hf_power = spectral_measures['HF Power']
+    lf_hf_ratio = spectral_measures['LF/HF Ratio']
+
     """
     6: The blocks below are there only to get the areas filled upto the actual band boundaries
     """
@@ -214,5 +251,3 @@ def welch_psd(Dataset, interpolate = True, fs=4, logscale = False,  nperseg=256,
     # Display the plot
     plt.tight_layout()
     plt.show()
-
-    return spectral_measures
\ No newline at end of file
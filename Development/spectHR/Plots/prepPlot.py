@@ -1,6 +1,5 @@
 import matplotlib.patches as patches
 from matplotlib.ticker import MultipleLocator
-from matplotlib.patches import FancyArrowPatch
 import matplotlib.pyplot as plt
 import matplotlib
 import ipyvuetify as v
@@ -9,8 +8,11 @@ import ipywidgets as widgets
 import math
 
 from spectHR.ui.LineHandler import LineHandler
+from spectHR.ui.Blitter import Blitter
 from spectHR.Tools.Logger import logger
+from spectHR.Tools.Decimate import pixel_width
 from spectHR.Plots.Poincare import poincare
+from spectHR.DataSet.AnomalyIndex import CLASSES
 
 import numpy as np
 import pandas as pd
@@ -44,34 +46,29 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
 
     def update_plot(x_min, x_max):
         """
-        Redraw the ECG plot, R-top times, and breathing rate (if available).
-        This function also adjusts the plot properties for the selected x-axis limits.
+        Updates the ECG plot, R-top times, and breathing rate (if available) for a new view.
+        The artists are persistent: only their data and the axis limits change.
 
         Parameters:
         - x_min (float): Minimum x-axis limit for the zoomed view.
         - x_max (float): Maximum x-axis limit for the zoomed view.
         """
-        plot_ecg_signal(ax_ecg, data.ecg.time, data.ecg.level)
+        update_ecg_signal(ax_ecg, *data.ecg.pyramid.query(x_min, x_max, pixel_width(ax_ecg)))
+        # Set the view first: the R-top layer decides on labels from the on-screen spacing
+        set_ecg_view(ax_ecg, x_min, x_max)
         # Plot R-top times if available in the data
-        if hasattr(data, "RTops"):
+        rtops = data.rtop_model
+        if rtops is not None:
             # Plot only R-tops within x_min and x_max
-            visibles = data.RTops[
-                (data.RTops["time"] >= x_min - 1) & (data.RTops["time"] <= x_max + 1)
-            ]
+            visibles = rtops.window(x_min - 1, x_max + 1)
 
-            if len(visibles) < 100:
-                plot_rtop_times(
-                    ax_ecg, visibles, line_handler
-                )  # Plot VLines in the current view, if there are less then 100
+            plot_rtop_times(ax_ecg, rtops, visibles, line_handler)  # One collection for all R-tops in view
 
             ax_ecg.set_ylim(ax_ecg.get_ylim()[0], ax_ecg.get_ylim()[1] * 1.2)
-        set_ecg_plot_properties(ax_ecg, x_min, x_max)
 
         # Plot the breathing rate if available in the data
         if ax_br is not None and data.br is not None:
-            plot_breathing_rate(
-                ax_br, data.br.time, data.br.level, x_min, x_max, line_handler
-            )
+            update_breathing_rate(ax_br, *data.br.pyramid.query(x_min, x_max, pixel_width(ax_br)))
         fig.canvas.draw_idle()
 
     def on_press(event):
@@ -92,13 +89,13 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
                     drag_mode = "right"
                 else:
                     drag_mode = "center"
+                # Only the zoom box moves while dragging: blit it over the cached figure
+                blitter.start(positional_patch)
 
         elif edit_mode == "Add":
             if event.inaxes == ax_ecg:
                 if edit_mode == "Add":
-                    datapoint = pd.DataFrame([{"time": event.xdata, "ID": "N", "epoch": None,"ibi": float("nan")}])
-                    data.RTops = pd.concat([data.RTops, datapoint], ignore_index=True)
-                    sort_rtop()
+                    data.rtop_model.add(event.xdata, ID="N", epoch=None)
                     update_plot(x_min, x_max)
 
     def on_drag(event):
@@ -107,7 +104,7 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         Adjusts the x_min and x_max limits depending on where the mouse is dragged.
         """
         nonlocal x_min, x_max, drag_mode, initial_xmin, initial_xmax
-        if event.inaxes == ax_overview:  # If click is on the overview plot
+        if event.inaxes == ax_overview and drag_mode is not None:  # Dragging the zoom box
             # Adjust the zoom limits based on drag mode (left, right, or center)
             if drag_mode == "left":
                 x_min = min(event.xdata, x_max - 0.1)
@@ -120,13 +117,15 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
             # Update the zoom box position
             positional_patch.set_x(x_min)
             positional_patch.set_width(x_max - x_min)
-            fig.canvas.draw_idle()
+            blitter.update()
 
     def on_release(event):
         """
         Resets the dragging mode upon mouse release.
         """
         nonlocal drag_mode
+        if blitter.artist is positional_patch:
+            blitter.stop()
         if event.inaxes == ax_overview: 
             drag_mode = None
             update_plot(x_min, x_max)
@@ -172,11 +171,13 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
             ax_br = None
         return fig, ax_ecg, ax_overview, ax_br
 
-    def plot_overview(ax, ecg_time, ecg_level, x_min, x_max):
+    def plot_overview(ax, ecg, x_min, x_max):
         """
         Plots the ECG signal on an overview plot with a shaded rectangle indicating the zoom region.
         """
         ax.clear()
+        # The overview always shows the whole recording, from the coarse end of the pyramid
+        ecg_time, ecg_level = ecg.pyramid.query(ecg.time.iat[0], ecg.time.iat[-1], pixel_width(ax))
         ax.plot(ecg_time, ecg_level, linewidth=0.25, alpha=0.5, color="green")
         ax.set_title("")
         # Initialize a draggable patch for the overview plot
@@ -196,87 +197,86 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         ax.spines["left"].set_visible(False)
         return positional_patch
 
-    def plot_rtop_times(ax, visibles, line_handler):
+    def plot_rtop_times(ax, rtops, visibles, line_handler):
         """
         Plots vertical lines and arrows for each R-top time with labels indicating the IBI value.
+        `visibles` is the slice of the R-top model that is in view.
         """
         h = ax.get_ylim()[1] + (0.05 * (ax.get_ylim()[1] - ax.get_ylim()[0]))
-        line_handler.clear()
-        for rtop in visibles.itertuples():
-            line_handler.add_line(rtop.time, color=RTopColors[rtop.ID])
-            if rtop.ibi != 0:
-                # Draw a double-sided arrow from the current R-top to the next
-                arrow = FancyArrowPatch(
-                    (rtop.time, h),
-                    (rtop.time + rtop.ibi, h),
-                    arrowstyle="<->",
-                    color="blue",
-                    mutation_scale=5,
-                    linewidth=0.5,
-                )
-                ax.add_patch(arrow)
-
-                ax.text(
-                    rtop.time + (0.5 * rtop.ibi),
-                    h,  # Offset above the plot
-                    f"{1000 * rtop.ibi:.0f}",
-                    fontsize=6,
-                    rotation=0,
-                    horizontalalignment="center",
-                    verticalalignment="bottom",
-                    color="blue",
-                    bbox=dict(
-                        facecolor=ax.get_facecolor(),
-                        edgecolor=ax.get_facecolor(),
-                        alpha=0.4,
-                    ),
-                )
-
-    def set_ecg_plot_properties(ax, x_min, x_max):
-        """
-        Configure ECG plot properties.
-        """
-        #ldisp = int(math.log10(abs(data.ecg.level.max() - data.ecg.level.min())))
-        tdisp = round(math.log10(x_max - x_min), 0)
+        line_handler.set_lines(
+            rtops["time"][visibles],
+            colors=[RTopColors[ID] for ID in rtops["ID"][visibles]],
+            ibis=rtops["ibi"][visibles],
+            height=h,
+        )
 
+    def set_ecg_plot_properties(ax):
+        """
+        Configure ECG plot properties and create the (initially empty) ECG line.
+        Called once: navigation only updates the data and limits (`update_ecg_signal`, `set_ecg_view`).
+        """
         ax.set_title("")
         ax.set_xlabel("Time (seconds)")
-        ax.set_xlim(x_min, x_max)
-        ax.xaxis.set_major_locator(
-            MultipleLocator(math.pow(10, tdisp - 1))
-        )  # Major ticks every 1 second
-        ax.xaxis.set_minor_locator(
-            MultipleLocator(math.pow(10, tdisp - 1) / 5)
-        )  # Minor ticks every 0.2 seconds
+        ax.xaxis.set_major_locator(MultipleLocator(1))
+        ax.xaxis.set_minor_locator(MultipleLocator(0.2))
         #ax.xaxis.grid(which="minor", color="salmon", lw=0.3)
         #ax.xaxis.grid(which="major", color="r", lw=0.7)
         ax.get_yaxis().set_visible(False)
         ax.spines[["right", "left", "top"]].set_visible(False)
         #ax.grid(False, "major", alpha=0.3)
         #ax.grid(False, "minor", alpha=0.2)
-
-    def plot_ecg_signal(ax, ecg_time, ecg_level):
-        """
-        Plot the ECG signal on the provided axis.
-        """
-        ax.clear()
-        ax.plot(
-            ecg_time,
-            ecg_level,
+        (ecg_line,) = ax.plot(
+            [],
+            [],
             label="ECG Signal",
             color="red",
             linewidth=.8,
             alpha=1,
         )
+        return ecg_line
 
-    def plot_breathing_rate(ax, br_time, br_level, x_min, x_max, line_handler):
+    def set_ecg_view(ax, x_min, x_max):
         """
-        Plot breathing rate data on a separate axis.
+        Set the x-limits of the ECG plot and scale the tick spacing to the view width.
         """
-        ax.clear()
-        ax.plot(br_time, br_level, label="Breathing Signal", color="green")
+        tdisp = round(math.log10(x_max - x_min), 0)
+        ax.set_xlim(x_min, x_max)
+        ax.xaxis.get_major_locator().set_params(base=math.pow(10, tdisp - 1))  # e.g. every 1 second
+        ax.xaxis.get_minor_locator().set_params(base=math.pow(10, tdisp - 1) / 5)  # e.g. every 0.2 seconds
+
+    def fit_ylim(ax, level):
+        """
+        Fit the y-limits to the data in view, with the default 5% margins.
+        """
+        finite = level[np.isfinite(level)]
+        if len(finite) == 0:
+            return
+        lo, hi = finite.min(), finite.max()
+        margin = 0.05 * (hi - lo) if hi > lo else 0.5
+        ax.set_ylim(lo - margin, hi + margin)
+
+    def update_ecg_signal(ax, ecg_time, ecg_level):
+        """
+        Replace the data of the ECG line with the samples of the current view.
+        """
+        ecg_line.set_data(ecg_time, ecg_level)
+        fit_ylim(ax, ecg_level)
+
+    def set_breathing_properties(ax):
+        """
+        Configure the breathing plot and create its (initially empty) line.
+        """
+        (br_line,) = ax.plot([], [], label="Breathing Signal", color="green")
         ax.set_ylabel("Breathing Level")
         ax.grid(True)
+        return br_line
+
+    def update_breathing_rate(ax, br_time, br_level):
+        """
+        Replace the data of the breathing line with the samples of the current view.
+        """
+        br_line.set_data(br_time, br_level)
+        fit_ylim(ax, br_level)
 
     def update_view():
         """
@@ -311,14 +311,29 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         x_max = x_min + x_range
         update_view()
 
+    def find_target(forward):
+        """
+        Time to center on for Previous/Next, from the anomaly index of the R-tops: the
+        closest anomalous R-top (of the selected class), or the start of the closest
+        low-quality segment, before x_min or after x_max. None if there is none.
+        """
+        rtops = data.rtop_model
+        if rtops is None:
+            return None
+        anomalies = rtops.anomalies
+        if jump_to == "Low quality":
+            segment = anomalies.next_segment(x_max) if forward else anomalies.previous_segment(x_min)
+            return segment[0] if segment is not None else None
+        label = None if jump_to == "Any" else jump_to
+        return anomalies.next(x_max, label) if forward else anomalies.previous(x_min, label)
+
     def on_prev_clicked(button, e, d):
         """
         Moves the view to center on the previous R-top with a specific label.
         """
         nonlocal x_min, x_max
         x_range = x_max - x_min
-        idx = (data.RTops["ID"] != "N") & (data.RTops["time"] < x_min)
-        center = data.RTops.loc[idx, "time"].iloc[-1] if idx.any() else None
+        center = find_target(forward=False)
 
         if center is not None:
             x_min = center - (0.5 * x_range)
@@ -353,8 +368,7 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         """
         nonlocal x_min, x_max
         x_range = x_max - x_min
-        idx = (data.RTops["ID"] != "N") & (data.RTops["time"] > x_max)
-        center = data.RTops.loc[idx, "time"].iloc[0] if idx.any() else None
+        center = find_target(forward=True)
 
         if center is not None:
             x_min = center - (0.5 * x_range)
@@ -386,45 +400,47 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         """
         Update the position of an R-top time after dragging.
 
-        This function updates the 'RTops' series
+        This function updates the R-top model; only the neighbouring IBIs are recalculated.
 
         Args:
             old_x (float): original value of the dragged r-top
             new_x (float): The new R-top time to update to
         """
-        # Find the index of the R-top time closest to the original position
-        closest_idx = (data.RTops["time"] - old_x).abs().idxmin()
-        # Update the R-top time at the closest index with the new value
-        data.RTops.at[closest_idx, "time"] = new_x
-        sort_rtop()
+        rtops = data.rtop_model
+        # Move the R-top closest to the original position
+        rtops.move(rtops.nearest(old_x), new_x)
+        update_plot(x_min, x_max)
 
     def remove_rtop(old_x, new_x):
         """
         Removes an R-top time.
 
-        This function updates the 'RTops' series
+        This function updates the R-top model; only the neighbouring IBI is recalculated.
 
         Args:
             old_x (float): original value of the to-be removed r-top
         """
         logger.info(f'removing line at: {old_x} vs {new_x}')
-        closest_idx = (data.RTops["time"] - new_x).abs().idxmin()
-        data.RTops = data.RTops.drop(index=closest_idx)
-        sort_rtop()
-
-    def sort_rtop():
+        rtops = data.rtop_model
+        # Remove the R-top the line was picked at, as the view did, not the one nearest the release
+        rtops.remove(rtops.nearest(old_x))
+        update_plot(x_min, x_max)
+    def on_undo_clicked(button, e, d):
         """
-        Sort the R-top times in ascending order and reset the index
-
-        This function updates the 'RTops' series and recaclulates the IBI series
+        Reverts the last R-top edit (see `EditJournal`).
+        """
+        rtops = data.rtop_model
+        if rtops is not None and data.journal.undo(rtops):
+            update_plot(x_min, x_max)
 
-        Args:
-            None
+    def on_redo_clicked(button, e, d):
         """
-        data.RTops = data.RTops.sort_values(by="time")
-        IBI = np.append(np.diff(data.RTops["time"]), float("nan"))
-        data.RTops["ibi"] = IBI
-        update_plot(x_min, x_max)
+        Re-applies the last undone R-top edit.
+        """
+        rtops = data.rtop_model
+        if rtops is not None and data.journal.redo(rtops):
+            update_plot(x_min, x_max)
+
     # Mode selection dropdown widget for interaction
     def update_mode(change, e, d):
         """
@@ -434,6 +450,13 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
         line_handler.update_mode(change.v_model)
         edit_mode = change.v_model
 
+    def update_jump_to(change, e, d):
+        """
+        Select what Previous/Next jump to.
+        """
+        nonlocal jump_to
+        jump_to = change.v_model
+
     # Main Plot: Configure theme
     plt.ioff()
     plt.title("")
@@ -449,16 +472,19 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
     fig.canvas.header_visible = False
     fig.tight_layout()
 
+    # area_handler = AreaHandler(fig, ax_ecg)
+    positional_patch = plot_overview(ax_overview, data.ecg, x_min, x_max)
+    # Persistent artists: created once (after the overview, which may share the x-axis),
+    # then updated in place by update_plot
+    ecg_line = set_ecg_plot_properties(ax_ecg)
+    br_line = set_breathing_properties(ax_br) if ax_br is not None else None
     line_handler = LineHandler(
         ax_ecg, callback_drag=update_rtop, callback_remove=remove_rtop
     )
-    # area_handler = AreaHandler(fig, ax_ecg)
-    positional_patch = plot_overview(
-        ax_overview, data.ecg.time, data.ecg.level, x_min, x_max
-    )
 
     # State variables for dragging
     drag_mode = None
+    blitter = Blitter(fig.canvas)
     initial_xmin, initial_xmax = x_min, x_max
 
     update_plot(x_min, x_max)
@@ -482,15 +508,45 @@ def prepPlot(data, x_min=None, x_max=None, plot_poincare=False):
 
     mode_select.on_event("change", update_mode)
 
+    """
+    What the Previous/Next buttons jump to: any labelled R-top, one class, or low-quality segments
+    """
+    jump_to = "Any"
+    jump_select = v.Select(
+        color="primary",
+        v_model="Any",
+        class_="ma-2",
+        label="Previous/Next",
+        items=["Any", *CLASSES, "Low quality"],
+    )
+
+    jump_select.on_event("change", update_jump_to)
+
     figure_title = widgets.HTML(
         value="<center><H2>ECG signal</H2></center>",
         layout=widgets.Layout(width="100%", justify_content="center"),
     )
 
-    spacer = widgets.Label(value="", layout=widgets.Layout(width="200px"))
+    """
+    Undo/redo buttons for the R-top edits
+    """
+    undo = v.Btn(
+        color="primary",
+        class_="ma-2",
+        children=[v.Icon(left=True, children=["fa-undo"]), 'Undo'],
+    )
+    redo = v.Btn(
+        color="primary",
+        class_="ma-2",
+        children=[v.Icon(left=True, children=["fa-repeat"]), 'Redo'],
+    )
+    undo.on_event("click", on_undo_clicked)
+    redo.on_event("click", on_redo_clicked)
+
+    history = widgets.HBox([undo, redo], layout=widgets.Layout(width="200px"))
 
     header = widgets.HBox(
-        [mode_select, figure_title, spacer],
+        [mode_select, jump_select, figure_title, history],
         layout=widgets.Layout(justify_content="center", width="100%"),
     )
     """
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+from spectHR.Tools.Explode import explode, epoch_segments
+from spectHR.Tools.Spectrum import BANDS, band_power, burg_psd, welch_segments
+from spectHR.Tools.Logger import logger
+
+
+def beat_pressures(DataSet):
+    """
+    Systolic and diastolic pressure of every beat, aligned to the R-tops.
+
+    The cardiac cycle of beat i runs from R-top i to R-top i + 1; the pressure pulse of that
+    beat arrives within it. SBP is the maximum and DBP the minimum of the blood pressure
+    signal over the cycle. Both are one segmented reduction (`np.maximum.reduceat` and
+    `np.minimum.reduceat`) over all cycles, located with `searchsorted`.
+
+    Args:
+        DataSet: A SpectHRDataset with a blood pressure channel (`bp`) and RTops.
+
+    Returns:
+        pd.DataFrame: Columns 'sbp' and 'dbp' (units of the bp channel, normally mmHg), with
+            the index of `DataSet.RTops`. Beats without a complete cycle in the bp signal are NaN.
+    """
+    rtops = DataSet.RTops.sort_values('time')
+    rtop_time = rtops['time'].to_numpy(dtype=float)
+    bp_time = DataSet.bp.time.to_numpy(dtype=float)
+    bp_level = DataSet.bp.level.to_numpy(dtype=float)
+
+    lo = np.searchsorted(bp_time, rtop_time[:-1])
+    hi = np.searchsorted(bp_time, rtop_time[1:])
+    complete = (hi > lo) & (lo > 0) & (hi < len(bp_time))
+
+    sbp = np.full(len(rtop_time), np.nan)
+    dbp = np.full(len(rtop_time), np.nan)
+    if complete.any():
+        bounds = np.column_stack((lo[complete], hi[complete])).ravel()
+        sbp[:-1][complete] = np.maximum.reduceat(bp_level, bounds)[::2]
+        dbp[:-1][complete] = np.minimum.reduceat(bp_level, bounds)[::2]
+
+    pressures = pd.DataFrame({'sbp': sbp, 'dbp': dbp}, index=rtops.index)
+    return pressures.reindex(DataSet.RTops.index)
+
+
+def pressure_sequences(sbp, ibi, starts, min_beats=3, sbp_threshold=1.0, ibi_threshold=5.0, min_r=0.8):
+    """
+    Finds baroreflex sequences: ramps of at least `min_beats` beats in which SBP and IBI
+    rise (or fall) together, and returns the IBI-on-SBP slope of every sequence.
+
+    The beat-to-beat changes are classified (+1 both up, -1 both down, 0 otherwise) and
+    the runs of equal class are found with one vectorized run-length encoding. Changes
+    that cross a segment (epoch) boundary are set to 0, so no sequence spans two epochs.
+    The regression of every sequence comes from prefix sums of the beat values.
+
+    Args:
+        sbp (np.ndarray): Systolic pressure per beat (mmHg), concatenated over segments.
+        ibi (np.ndarray): IBI per beat (ms), paired with the SBP of the same beat.
+        starts (np.ndarray): Offset of the first beat of each segment.
+        min_beats (int, optional): Minimum sequence length in beats. Defaults to 3.
+        sbp_threshold (float, optional): Minimum SBP change per beat (mmHg). Defaults to 1.
+        ibi_threshold (float, optional): Minimum IBI change per beat (ms). Defaults to 5.
+        min_r (float, optional): Minimum correlation of IBI and SBP in a sequence. Defaults to 0.8.
+
+    Returns:
+        pd.DataFrame: One row per accepted sequence with the columns segment, start (beat
+            offset), beats, direction (+1 up, -1 down), slope (ms/mmHg) and r.
+    """
+    sbp = np.asarray(sbp, dtype=float)
+    ibi = np.asarray(ibi, dtype=float)
+    d_sbp, d_ibi = np.diff(sbp), np.diff(ibi)
+    up = (d_sbp >= sbp_threshold) & (d_ibi >= ibi_threshold)
+    down = (d_sbp <= -sbp_threshold) & (d_ibi <= -ibi_threshold)
+    kind = up.astype(int) - down.astype(int)
+    kind[np.asarray(starts)[1:] - 1] = 0  # no ramps across segment boundaries
+
+    # Run-length encoding of the change classes
+    run_start = np.flatnonzero(np.diff(kind, prepend=np.nan))
+    run_length = np.diff(np.append(run_start, len(kind)))
+    run_kind = kind[run_start]
+    keep = (run_kind != 0) & (run_length >= min_beats - 1)
+    first, beats, direction = run_start[keep], run_length[keep] + 1, run_kind[keep]
+
+    # Least squares IBI = slope * SBP + c per sequence, from prefix sums
+    def prefix(values):
+        return np.concatenate(([0.0], np.cumsum(values)))
+
+    def seq_sum(p):
+        return p[first + beats] - p[first]
+
+    x, y = np.nan_to_num(sbp), np.nan_to_num(ibi)
+    n = beats
+    sx, sy = seq_sum(prefix(x)), seq_sum(prefix(y))
+    sxx, syy, sxy = seq_sum(prefix(x * x)), seq_sum(prefix(y * y)), seq_sum(prefix(x * y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx ** 2 / n
+        var_y = syy - sy ** 2 / n
+        slope = cov / var_x
+        r = cov / np.sqrt(var_x * var_y)
+
+    sequences = pd.DataFrame({
+        'segment': np.searchsorted(starts, first, side='right') - 1,
+        'start': first,
+        'beats': beats,
+        'direction': direction,
+        'slope': slope,
+        'r': r,
+    })
+    return sequences[sequences['r'] >= min_r].reset_index(drop=True)
+
+
+def baroreflex(DataSet, engine='welch', fs=4, nperseg=256, noverlap=128, nfft=2**12, min_beats=3):
+    """
+    Blood pressure and baroreflex sensitivity (BRS) of every visible epoch.
+
+    - sbp, dbp: mean systolic and diastolic pressure (`beat_pressures`).
+    - brs_seq: sequence BRS, the mean slope (ms/mmHg) of all up and down sequences in the
+      epoch (`pressure_sequences`), with brs_n the number of sequences.
+    - alpha_lf, alpha_hf: spectral alpha index sqrt(P_IBI / P_SBP) in the LF and HF bands.
+      The IBI and SBP spectra of all epochs come from one batched call (`welch_segments`,
+      or `burg_psd` with engine='burg' for short epochs).
+
+    Args:
+        DataSet: A SpectHRDataset with a blood pressure channel (`bp`), RTops and epochs.
+        engine (str, optional): 'welch' (default) or 'burg'.
+        fs, nperseg, noverlap, nfft: Spectral parameters, as in `epoch_psd`.
+        min_beats (int, optional): Minimum sequence length in beats. Defaults to 3.
+
+    Returns:
+        pd.DataFrame: One row per epoch (index 'epoch') with the columns sbp, dbp, brs_seq,
+            brs_n, alpha_lf and alpha_hf.
+    """
+    exploded = explode(DataSet, DataSet.RTops.join(beat_pressures(DataSet)))
+    epochs, ibi, starts = epoch_segments(exploded, 'ibi')
+    _, sbp, _ = epoch_segments(exploded, 'sbp')
+    _, dbp, _ = epoch_segments(exploded, 'dbp')
+    _, times, _ = epoch_segments(exploded, 'time')
+    columns = ['sbp', 'dbp', 'brs_seq', 'brs_n', 'alpha_lf', 'alpha_hf']
+    if len(ibi) == 0:
+        return pd.DataFrame(columns=columns, index=epochs)
+
+    # Beats without a pressure pulse are NaN: they break sequences and are left out of the
+    # means and the spectra
+    valid = np.isfinite(sbp) & np.isfinite(dbp)
+    n_valid = np.add.reduceat(valid, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = pd.DataFrame({
+            'sbp': np.add.reduceat(np.where(valid, sbp, 0), starts) / n_valid,
+            'dbp': np.add.reduceat(np.where(valid, dbp, 0), starts) / n_valid,
+        }, index=epochs)
+
+    sequences = pressure_sequences(sbp, 1000 * ibi, starts, min_beats)
+    per_epoch = sequences.groupby('segment')['slope'].agg(['mean', 'size'])
+    result['brs_seq'] = per_epoch['mean'].reindex(range(len(epochs))).to_numpy()
+    result['brs_n'] = per_epoch['size'].reindex(range(len(epochs)), fill_value=0).to_numpy()
+
+    # Spectral alpha: IBI (ms) and SBP spectra of all epochs in one batch each, using the
+    # beats with a pressure pulse of the epochs that have at least three of them
+    n = np.diff(np.append(starts, len(ibi)))
+    spectral = n_valid >= 3
+    keep = valid & np.repeat(spectral, n)
+    counts = n_valid[spectral]
+    keep_starts = np.cumsum(counts) - counts
+    times, ibi, sbp = times[keep], 1000 * ibi[keep], sbp[keep]
+    if engine == 'welch':
+        freqs, p_ibi = welch_segments(times, ibi, keep_starts, fs, nperseg, noverlap, nfft)
+        _, p_sbp = welch_segments(times, sbp, keep_starts, fs, nperseg, noverlap, nfft)
+    elif engine == 'burg':
+        freqs = np.fft.rfftfreq(nfft, 1 / fs)
+        p_ibi, _ = burg_psd(times, ibi, keep_starts, freqs, fs)
+        p_sbp, _ = burg_psd(times, sbp, keep_starts, freqs, fs)
+    else:
+        raise ValueError(f"Unknown spectral engine '{engine}'")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in ('LF', 'HF'):
+            band = BANDS[name]
+            alpha = np.full(len(epochs), np.nan)
+            alpha[spectral] = np.sqrt(band_power(freqs, p_ibi, band) / band_power(freqs, p_sbp, band))
+            result[f'alpha_{name.lower()}'] = alpha
+
+    logger.info(f"Baroreflex: {len(sequences)} sequences")
+    return result[columns]
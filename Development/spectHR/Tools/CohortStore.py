@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+from spectHR.Tools.Logger import logger
+
+
+def parameter_set(par):
+    """
+    Returns a short, stable identifier for a parameter dictionary.
+
+    Args:
+        par (dict): Parameters, e.g. `DataSet.par`.
+
+    Returns:
+        str: The first 12 hex digits of the SHA-1 of the (sorted) JSON representation.
+    """
+    return hashlib.sha1(json.dumps(par, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+class CohortStore:
+    """
+    A cohort-wide store of per-epoch results (descriptives and PSD band powers).
+
+    Results are kept in long format, one row per (subject, epoch, param_set, parameter),
+    and are upserted: storing a subject again replaces only its own rows. Cohort queries
+    and re-exports therefore never have to re-parse one CSV file per subject.
+
+    Two backends are available:
+        - 'sqlite': a single SQLite database file, indexed on subject and epoch.
+        - 'parquet': a directory partitioned per subject (`subject=<id>/results.parquet`).
+          Requires pyarrow.
+
+    Methods:
+        upsert(subject, results, param_set='default', parameters=None):
+            Inserts or replaces the results of one subject.
+        store(DataSet, results=None):
+            Upserts the (descriptives) results of a SpectHRDataset.
+        query(subjects=None, epochs=None, param_set=None):
+            Returns the stored results as a wide DataFrame.
+        export_csv(file_path, **kwargs):
+            Writes (a selection of) the cohort to a single CSV file.
+    """
+
+    def __init__(self, path, backend='sqlite'):
+        """
+        Opens (or creates) a cohort store.
+
+        Args:
+            path (str): The SQLite database file, or the Parquet directory.
+            backend (str, optional): 'sqlite' or 'parquet'. Defaults to 'sqlite'.
+
+        Raises:
+            ValueError: If the backend is unknown.
+            ImportError: If the parquet backend is requested and pyarrow is not installed.
+        """
+        if backend not in ('sqlite', 'parquet'):
+            raise ValueError(f"Unknown backend '{backend}', use 'sqlite' or 'parquet'")
+        if backend == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise ImportError("The parquet backend of CohortStore requires pyarrow") from e
+
+        self.path = path
+        self.backend = backend
+
+        if backend == 'sqlite':
+            with self._connect() as con:
+                con.executescript("""
+                    CREATE TABLE IF NOT EXISTS results (
+                        subject TEXT NOT NULL,
+                        epoch TEXT NOT NULL,
+                        param_set TEXT NOT NULL,
+                        parameter TEXT NOT NULL,
+                        value REAL,
+                        PRIMARY KEY (subject, epoch, param_set, parameter)
+                    );
+                    CREATE INDEX IF NOT EXISTS results_subject ON results (subject);
+                    CREATE INDEX IF NOT EXISTS results_epoch ON results (epoch);
+                    CREATE TABLE IF NOT EXISTS parameter_sets (
+                        param_set TEXT PRIMARY KEY,
+                        parameters TEXT
+                    );
+                """)
+        else:
+            Path(path).mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection that commits on success and is always closed."""
+        con = sqlite3.connect(self.path)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _partition(self, subject):
+        return Path(self.path) / f'subject={subject}' / 'results.parquet'
+
+    def upsert(self, subject, results, param_set='default', parameters=None):
+        """
+        Inserts or replaces the per-epoch results of one subject.
+
+        Args:
+            subject (str): The subject identifier.
+            results (pd.DataFrame): Per-epoch results, either indexed by 'epoch' or with an
+                'epoch' column. All other numeric columns are stored as parameters.
+            param_set (str, optional): Identifier of the analysis parameters the results were
+                computed with (see `parameter_set`). Defaults to 'default'.
+            parameters (dict, optional): The parameters themselves, stored for provenance.
+        """
+        table = results if 'epoch' in results.columns else results.rename_axis('epoch').reset_index()
+        table = table.drop(columns=[c for c in ('id', 'subject', 'param_set') if c in table.columns])
+        long = table.melt(id_vars='epoch', var_name='parameter', value_name='value')
+        long['value'] = pd.to_numeric(long['value'], errors='coerce')
+        long = long.assign(subject=str(subject), epoch=long['epoch'].astype(str), param_set=param_set)
+        long = long[['subject', 'epoch', 'param_set', 'parameter', 'value']]
+
+        if self.backend == 'sqlite':
+            with self._connect() as con:
+                con.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                long.itertuples(index=False, name=None))
+                if parameters is not None:
+                    con.execute("INSERT OR REPLACE INTO parameter_sets VALUES (?, ?)",
+                                (param_set, json.dumps(parameters, sort_keys=True, default=str)))
+        else:
+            partition = self._partition(subject)
+            if partition.exists():
+                old = pd.read_parquet(partition)
+                keys = ['epoch', 'param_set', 'parameter']
+                replaced = old.set_index(keys).index.isin(long.set_index(keys).index)
+                long = pd.concat([old[~replaced], long.drop(columns='subject')], ignore_index=True)
+            else:
+                partition.parent.mkdir(parents=True, exist_ok=True)
+                long = long.drop(columns='subject')
+            long.sort_values(['epoch', 'param_set']).to_parquet(partition, index=False)
+
+        logger.info(f"Stored {len(table)} epochs of '{subject}' in cohort store {self.path}")
+
+    def store(self, DataSet, results=None):
+        """
+        Upserts the results of a SpectHRDataset, keyed on its file name and parameters.
+
+        Args:
+            DataSet: The SpectHRDataset the results belong to.
+            results (pd.DataFrame, optional): Defaults to `DataSet.descriptives_Values`, which
+                includes the PSD band powers when these were computed.
+        """
+        results = DataSet.descriptives_Values if results is None else results
+        self.upsert(os.path.splitext(DataSet.filename)[0], results,
+                    param_set=parameter_set(DataSet.par), parameters=DataSet.par)
+
+    def query(self, subjects=None, epochs=None, param_set=None):
+        """
+        Returns stored results as a wide table: one row per (subject, epoch, param_set).
+
+        Args:
+            subjects (iterable, optional): Restrict to these subjects.
+            epochs (iterable, optional): Restrict to these epochs.
+            param_set (str, optional): Restrict to this parameter set.
+
+        Returns:
+            pd.DataFrame: Columns subject, epoch, param_set, followed by one column per parameter.
+        """
+        if self.backend == 'sqlite':
+            clauses, args = [], []
+            for column, values in (('subject', subjects), ('epoch', epochs)):
+                if values is not None:
+                    values = [str(v) for v in values]
+                    clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                    args += values
+            if param_set is not None:
+                clauses.append("param_set = ?")
+                args.append(param_set)
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            with self._connect() as con:
+                long = pd.read_sql_query(f"SELECT * FROM results{where} ORDER BY rowid", con, params=args)
+        else:
+            filters = []
+            if subjects is not None:
+                filters.append(('subject', 'in', [str(s) for s in subjects]))
+            if epochs is not None:
+                filters.append(('epoch', 'in', [str(e) for e in epochs]))
+            if param_set is not None:
+                filters.append(('param_set', '==', param_set))
+            if not any(Path(self.path).glob('subject=*')):
+                long = pd.DataFrame(columns=['subject', 'epoch', 'param_set', 'parameter', 'value'])
+            else:
+                long = pd.read_parquet(self.path, filters=filters or None)
+                long['subject'] = long['subject'].astype(str)
+
+        keys = ['subject', 'epoch', 'param_set']
+        wide = long.pivot_table(index=keys, columns='parameter', values='value', aggfunc='first', dropna=False)
+        wide = wide.reindex(columns=long['parameter'].unique())
+        wide.columns.name = None
+        return wide.reset_index()
+
+    def export_csv(self, file_path, **kwargs):
+        """
+        Writes the stored results to a single CSV file (replacing the per-subject CSVs).
+
+        Args:
+            file_path (str): The CSV file to write.
+            **kwargs: Selection arguments passed on to `query`.
+        """
+        self.query(**kwargs).to_csv(file_path, index=False)
+        logger.info(f"Cohort exported to {file_path}")
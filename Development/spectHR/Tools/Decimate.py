@@ -0,0 +1,135 @@
+import numpy as np
+
+
+def visible_slice(time, x_min, x_max):
+    """
+    Index range of the samples within [x_min, x_max], plus one sample on either side so
+    that a line drawn from them runs up to the edges of the view.
+
+    Args:
+        time (np.ndarray): Sorted sample times.
+        x_min (float): Left edge of the view.
+        x_max (float): Right edge of the view.
+
+    Returns:
+        slice: The sample range to draw.
+    """
+    i0 = max(np.searchsorted(time, x_min, side='left') - 1, 0)
+    i1 = min(np.searchsorted(time, x_max, side='right') + 1, len(time))
+    return slice(i0, i1)
+
+
+def minmax_decimate(time, level, x_min, x_max, n_columns):
+    """
+    Reduces the visible part of a signal to at most one min/max pair per screen column.
+
+    Only the samples within [x_min, x_max] are considered (`visible_slice`). If there are
+    more than 2 * n_columns of them, they are cut into n_columns bins and every bin is
+    replaced by its minimum and maximum sample, in their original order. The resulting
+    line looks the same as the full one at this resolution (every peak, such as an R-top,
+    stays visible), but its size depends only on the screen width, not on the recording
+    length.
+
+    Args:
+        time (array-like): Sorted sample times.
+        level (array-like): Sample values.
+        x_min (float): Left edge of the view.
+        x_max (float): Right edge of the view.
+        n_columns (int): Number of bins, normally the width of the axes in pixels.
+
+    Returns:
+        tuple: (time, level) arrays of at most 2 * n_columns (+ 2) real samples.
+    """
+    time = np.asarray(time)
+    level = np.asarray(level)
+    window = visible_slice(time, x_min, x_max)
+    t, y = time[window], level[window]
+    n_columns = max(int(n_columns), 1)
+    if len(t) <= 2 * n_columns:
+        return t, y
+
+    return _minmax_bins(t, y, -(-len(y) // n_columns))
+
+
+def _minmax_bins(t, y, per_bin):
+    """
+    Replaces every bin of `per_bin` consecutive samples by its min and max sample, in time order.
+    """
+    # Equal-count bins; the last bin is padded with its final sample (leaves min/max intact)
+    n_bins = -(-len(y) // per_bin)
+    padded = np.pad(y, (0, per_bin * n_bins - len(y)), mode='edge').reshape(n_bins, per_bin)
+    offsets = np.arange(n_bins) * per_bin
+    missing = np.isnan(padded)
+    lo = np.argmin(np.where(missing, np.inf, padded), axis=1)
+    hi = np.argmax(np.where(missing, -np.inf, padded), axis=1)
+
+    # Keep each pair in time order so the line is drawn left to right
+    index = np.column_stack((np.minimum(lo, hi), np.maximum(lo, hi))) + offsets[:, None]
+    index = np.minimum(index.ravel(), len(y) - 1)
+    return t[index], y[index]
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max representation of a signal, for instant browsing.
+
+    Level 0 is the signal itself. Every next level replaces bins of `factor` samples of
+    the previous level by their min and max sample (so it is factor / 2 times shorter),
+    until a level is shorter than `min_length`. With factor=8 all levels together add
+    about a third to the size of the signal.
+
+    A view is then served from the coarsest level that still has at least two samples per
+    screen column in the view, found with one `searchsorted` per level. The slice of that
+    level is at most `factor` times the number of columns, so a query costs O(pixels)
+    regardless of the recording length or the zoom level.
+
+    Attributes:
+        levels (list): (time, level) array pairs, from full resolution to coarsest.
+
+    Methods:
+        query(x_min, x_max, n_columns):
+            The decimated samples for a view.
+    """
+
+    def __init__(self, time, level, factor=8, min_length=4096):
+        """
+        Builds all levels of the pyramid.
+
+        Args:
+            time (array-like): Sorted sample times.
+            level (array-like): Sample values.
+            factor (int, optional): Reduction per level (in samples per bin). Defaults to 8.
+            min_length (int, optional): Stop when a level is shorter than this. Defaults to 4096.
+        """
+        t = np.asarray(time, dtype=float)
+        y = np.asarray(level, dtype=float)
+        self.factor = factor
+        self.levels = [(t, y)]
+        while len(t) >= max(min_length, 2 * factor):
+            t, y = _minmax_bins(t, y, factor)
+            self.levels.append((t, y))
+
+    def query(self, x_min, x_max, n_columns):
+        """
+        Returns the samples to draw for the view [x_min, x_max] at n_columns screen columns.
+
+        Args:
+            x_min (float): Left edge of the view.
+            x_max (float): Right edge of the view.
+            n_columns (int): Number of screen columns, normally the axes width in pixels.
+
+        Returns:
+            tuple: (time, level) arrays of at most 2 * n_columns (+ 2) samples.
+        """
+        n_columns = max(int(n_columns), 1)
+        for t, y in reversed(self.levels):
+            window = visible_slice(t, x_min, x_max)
+            if window.stop - window.start >= 2 * n_columns or t is self.levels[0][0]:
+                return minmax_decimate(t[window], y[window], x_min, x_max, n_columns)
+
+
+def pixel_width(ax):
+    """
+    Width of a Matplotlib axes in screen pixels.
+    """
+    return int(np.ceil(ax.get_window_extent().width))
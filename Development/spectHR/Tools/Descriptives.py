@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from spectHR.Tools.Explode import explode, epoch_segments
+from spectHR.Tools.Nonlinear import dfa, sample_entropy, approximate_entropy
+from spectHR.Tools.Bootstrap import bootstrap_ci
+
+
+def descriptives(DataSet, nonlinear=False, bootstrap=False, n_boot=1000, seed=None):
+    """
+    Computes the descriptive HRV statistics of all visible epochs in a single vectorized pass.
+
+    The successive differences and the per-epoch segment boundaries are built once, after
+    which every statistic is a segmented reduction (`np.add.reduceat` and friends) over
+    all epochs at the same time. No Python code runs per epoch.
+
+    Units follow the previous `groupby` implementation: N, mean, std, min and max are in
+    seconds (std with ddof=1); RMSSD, SDNN and SDSD are in ms (as returned by `pyhrv`,
+    but without its truncation to whole milliseconds; like pyhrv, SDSD is the std of the
+    absolute successive differences); SD1, SD2 and the ellipse area are in ms as computed
+    in `Tools/Params.py`.
+
+    With `nonlinear=True` the DFA exponents and the sample and approximate entropy (see
+    `Tools/Nonlinear.py`) are added. These need one (internally vectorized) call per epoch.
+
+    With `bootstrap=True` block-bootstrap confidence intervals (95%) for SDNN, RMSSD and
+    LF/HF are added as <metric>_ci_low and <metric>_ci_high (see `Tools/Bootstrap.py`).
+
+    Args:
+        DataSet: A SpectHRDataset with RTops and epoch information (see `explode`).
+        nonlinear (bool, optional): Also compute dfa_alpha1, dfa_alpha2, sampen and apen.
+            Defaults to False.
+        bootstrap (bool, optional): Also compute bootstrap confidence intervals. Defaults to False.
+        n_boot (int, optional): Number of bootstrap resamples. Defaults to 1000.
+        seed (int, optional): Seed for reproducible bootstrap intervals.
+
+    Returns:
+        pd.DataFrame: One row per epoch (index 'epoch') with the columns
+            N, mean, std, min, max, rmssd, sdnn, sdsd, sd1, sd2, sd_ratio, ellipse_area
+            (and the nonlinear metrics and confidence intervals, if requested).
+    """
+    exploded = explode(DataSet)
+    epochs, ibi, starts = epoch_segments(exploded)
+    if len(ibi) == 0:
+        return pd.DataFrame(columns=['N', 'mean', 'std', 'min', 'max', 'rmssd', 'sdnn', 'sdsd',
+                                     'sd1', 'sd2', 'sd_ratio', 'ellipse_area'],
+                            index=epochs)
+
+    n = np.diff(np.append(starts, len(ibi)))
+    m = n - 1  # number of successive differences per epoch
+
+    # Successive differences and sums, padded to len(ibi). The pair starting at the last
+    # beat of a segment crosses into the next epoch and is masked out.
+    valid = np.ones(len(ibi))
+    valid[starts + n - 1] = 0
+    diff = np.append(np.diff(ibi), 0) * valid
+    pair = np.append(ibi[:-1] + ibi[1:], 0) * valid
+
+    def segment_sum(x):
+        return np.add.reduceat(x, starts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = segment_sum(ibi) / n
+        ss = segment_sum((ibi - np.repeat(mean, n)) ** 2)
+
+        diff_mean = segment_sum(diff) / m
+        diff_ss = segment_sum(((diff - np.repeat(diff_mean, n)) * valid) ** 2)
+        # SDSD (pyhrv) is the spread of the absolute differences; SD1 uses the signed ones
+        abs_mean = segment_sum(np.abs(diff)) / m
+        abs_ss = segment_sum(((np.abs(diff) - np.repeat(abs_mean, n)) * valid) ** 2)
+        pair_mean = segment_sum(pair) / m
+        pair_ss = segment_sum(((pair - np.repeat(pair_mean, n)) * valid) ** 2)
+
+        std = np.sqrt(ss / (n - 1))
+        rmssd = 1000 * np.sqrt(segment_sum(diff ** 2) / m)
+        sdsd = 1000 * np.sqrt(abs_ss / (m - 1))
+        sd1 = 1000 * np.sqrt(diff_ss / m / 2)
+        sd2 = 1000 * np.sqrt(pair_ss / m / 2)
+
+        stats = pd.DataFrame({
+            'N': n,
+            'mean': mean,
+            'std': std,
+            'min': np.minimum.reduceat(ibi, starts),
+            'max': np.maximum.reduceat(ibi, starts),
+            'rmssd': rmssd,
+            'sdnn': 1000 * std,
+            'sdsd': sdsd,
+            'sd1': sd1,
+            'sd2': sd2,
+            'sd_ratio': sd1 / sd2,
+            'ellipse_area': np.pi * sd1 * sd2,
+        }, index=epochs)
+
+    segments = np.split(ibi, starts[1:])
+    if nonlinear:
+        alphas = np.array([dfa(segment) for segment in segments]).reshape(-1, 2)
+        stats['dfa_alpha1'] = alphas[:, 0]
+        stats['dfa_alpha2'] = alphas[:, 1]
+        stats['sampen'] = [sample_entropy(segment) for segment in segments]
+        stats['apen'] = [approximate_entropy(segment) for segment in segments]
+
+    if bootstrap:
+        rng = np.random.default_rng(seed)
+        times = np.split(epoch_segments(exploded, 'time')[1], starts[1:])
+        intervals = [bootstrap_ci(segment, time, n_boot=n_boot, seed=rng, name=epoch)
+                     for segment, time, epoch in zip(segments, times, epochs)]
+        for metric in ('sdnn', 'rmssd', 'lf_hf'):
+            stats[f'{metric}_ci_low'] = [ci[metric][0] for ci in intervals]
+            stats[f'{metric}_ci_high'] = [ci[metric][1] for ci in intervals]
+    return stats
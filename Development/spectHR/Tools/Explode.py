@@ -1,58 +1,189 @@
-def explode(DataSet):
+import numpy as np
+import pandas as pd
+
+
+# Epoch membership is a bitmask per sample or beat: bit i stands for epoch_names[i]
+MAX_EPOCHS = 64
+
+
+def epoch_bit(i):
+    """
+    The bitmask of the i-th epoch in the registry.
+    """
+    return np.uint64(1) << np.uint64(i)
+
+
+def masks_from_lists(lists, names):
     """
-    Filters and explodes the 'epoch' column of a DataSet's RTops DataFrame based on visible epochs.
+    Bitmasks of epoch lists (as in the 'epoch' column of RTops), one per list.
+
+    Args:
+        lists (iterable): Lists of epoch names; None or NaN stands for no epoch.
+        names (list): The epoch-name registry. Names not in it are ignored.
+
+    Returns:
+        np.ndarray: uint64 bitmasks.
+    """
+    index = {name: i for i, name in enumerate(names[:MAX_EPOCHS])}
+    masks = {}
+
+    def mask(epochs):
+        if not isinstance(epochs, (list, tuple)):
+            return 0
+        key = tuple(epochs)
+        if key not in masks:
+            masks[key] = sum(1 << index[e] for e in set(key) if e in index)
+        return masks[key]
+
+    return np.fromiter((mask(epochs) for epochs in lists), dtype=np.uint64)
+
+
+def lists_from_masks(masks, names):
+    """
+    Epoch lists of bitmasks (the inverse of `masks_from_lists`), in registry order.
+    Equal masks share one list object: treat the lists as read-only.
+
+    Returns:
+        np.ndarray: Object array of lists, one per mask.
+    """
+    unique, inverse = np.unique(np.asarray(masks, dtype=np.uint64), return_inverse=True)
+    lists = np.empty(len(unique), dtype=object)
+    for j, mask in enumerate(unique):
+        lists[j] = [name for i, name in enumerate(names) if mask & epoch_bit(i)]
+    return lists[inverse.reshape(-1)]
+
+
+def epoch_masks(DataSet, RTops=None):
+    """
+    Epoch membership of the R-tops as bitmasks, with the epoch-name registry.
+
+    The masks come from the 'epoch_mask' column that `calcPeaks` stores next to the epoch
+    lists. For R-tops without it (datasets processed before it existed) they are derived
+    from the 'epoch' lists, in one pass over the distinct lists.
+
+    Args:
+        DataSet: An object with RTops and `epoch_names` (or, before the registry existed,
+            `unique_epochs`).
+        RTops (pd.DataFrame, optional): Table to use instead of `DataSet.RTops`.
+
+    Returns:
+        tuple:
+            - masks (np.ndarray): uint64 bitmask per row; bit i is epoch names[i].
+            - names (list): The epoch-name registry.
+    """
+    RTops = DataSet.RTops if RTops is None else RTops
+    names = getattr(DataSet, 'epoch_names', None)
+    if names is not None and 'epoch_mask' in RTops.columns:
+        return RTops['epoch_mask'].to_numpy(dtype=np.uint64), list(names)
+    names = list(names) if names is not None else sorted(DataSet.unique_epochs)
+    return masks_from_lists(RTops['epoch'], names), names
+
+
+def visible_mask(DataSet, names):
+    """
+    Bitmask of the visible epochs: those marked True in `active_epochs` (if available),
+    or else all epochs.
+
+    Args:
+        DataSet: An object with optional `active_epochs`.
+        names (list): The epoch-name registry.
+
+    Returns:
+        np.uint64: The bitmask.
+    """
+    active = getattr(DataSet, 'active_epochs', None)
+    mask = np.uint64(0)
+    for i, name in enumerate(names[:MAX_EPOCHS]):
+        if not isinstance(active, dict) or active.get(name, False):
+            mask |= epoch_bit(i)
+    return mask
+
+
+def explode(DataSet, RTops=None):
+    """
+    Filters and explodes the epoch membership of a DataSet's RTops based on visible epochs.
 
     This function processes RTops data within a DataSet object:
-    1. Determines visible epochs based on `active_epochs` (if available) or `unique_epochs`.
-    2. Filters RTops rows to include only visible epochs in the 'epoch' column.
-    3. Explodes the 'epoch' column where it contains lists of epochs.
+    1. Determines visible epochs based on `active_epochs` (if available) or all epochs.
+    2. Keeps the R-tops that belong to at least one visible epoch.
+    3. Repeats every R-top once per visible epoch it belongs to, in the 'epoch' column.
     4. Removes rows with missing IBI values.
 
+    Membership is tested on the epoch bitmasks (see `epoch_masks`) with vectorized bit
+    operations, instead of on the epoch lists.
+
     Args:
         DataSet: An object containing RTops data and epoch-related metadata.
             Required attributes:
                 - RTops (pd.DataFrame): A DataFrame with at least:
-                    * 'epoch': A column containing lists of epochs.
+                    * 'epoch_mask' or 'epoch': Epoch membership as bitmasks or lists.
                     * 'ibi': A column with inter-beat interval (IBI) data.
+                - epoch_names (list): The epoch-name registry (or, for older datasets,
+                    unique_epochs).
                 - active_epochs (dict, optional): A dict where keys are epoch names 
                     and values are booleans indicating visibility.
-                - unique_epochs (iterable): A fallback list of all epochs.
+        RTops (pd.DataFrame, optional): Table to use instead of `DataSet.RTops`, e.g. one
+            with extra per-beat columns. Defaults to None.
 
     Returns:
         pd.DataFrame: A DataFrame where:
-            - The 'epoch' column is exploded into individual rows.
+            - Every row is one (R-top, visible epoch) pair, in R-top order, with the epoch
+              name in the 'epoch' column.
             - Rows with missing 'ibi' values are dropped.
 
     Example:
         exploded_data = explode(my_dataset)
     """
-    # Step 1: Determine visible epochs
-    if hasattr(DataSet, 'active_epochs') and isinstance(DataSet.active_epochs, dict):
-        # Use active_epochs if available, filtering for epochs marked as visible (True)
-        visible_epochs = {epoch for epoch, visible in DataSet.active_epochs.items() if visible}
-    else:
-        # Fallback: Assume all unique_epochs are visible
-        visible_epochs = set(DataSet.unique_epochs)
-    
-    # Step 2: Filter RTops rows containing any visible epochs
-    def filter_visible_epochs(epoch_list):
-        """Helper function to filter epochs within a list based on visibility."""
-        return [epoch for epoch in epoch_list if epoch in visible_epochs]
-    
-    filtered_data = DataSet.RTops.copy()
-    filtered_data = filtered_data[
-        filtered_data['epoch'].apply(
-            lambda epochs: any(epoch in visible_epochs if visible_epochs is not None else False for epoch in epochs)
-            if epochs is not None else False
-        )
-    ]
-    #filtered_data = filtered_data[
-    #    filtered_data['epoch'].apply(lambda epochs: any(epoch in visible_epochs if visible_epochs is not None else False for epoch in epochs))
-    #]
-    
-    # Step 3: Clean and explode the 'epoch' column
-    filtered_data['epoch'] = filtered_data['epoch'].apply(filter_visible_epochs)  # Keep only visible epochs
-    exploded_data = filtered_data.explode('epoch')  # Explode epoch lists into individual rows
-    
-    # Step 4: Drop rows with missing IBI values
+    RTops = DataSet.RTops if RTops is None else RTops
+    masks, names = epoch_masks(DataSet, RTops)
+    masks = masks & visible_mask(DataSet, names)
+
+    # (beat, epoch) membership matrix; its nonzero entries come out in beat order
+    bits = np.arange(min(len(names), MAX_EPOCHS), dtype=np.uint64)
+    member = (masks[:, None] >> bits) & np.uint64(1)
+    rows, columns = np.nonzero(member)
+
+    exploded_data = RTops.iloc[rows].assign(epoch=np.asarray(names, dtype=object)[columns])
     return exploded_data.dropna(subset=['ibi'])
+
+
+def epoch_segments(exploded, column='ibi'):
+    """
+    Orders an exploded RTops table by epoch and returns the contiguous segments.
+
+    The rows are stably sorted on their epoch name, so the beats within an epoch keep
+    their original (time) order. Every epoch then occupies one contiguous slice of the
+    returned value array, described by its start offset. This is the same grouping
+    `groupby('epoch')` produces, but as flat arrays that can be fed to `np.*.reduceat`.
+
+    Args:
+        exploded (pd.DataFrame): Output of `explode`, one row per (beat, epoch).
+        column (str, optional): Column to extract. Defaults to 'ibi'.
+
+    Returns:
+        tuple:
+            - epochs (pd.Index): Sorted epoch names, one per segment.
+            - values (np.ndarray): The column values, ordered by epoch.
+            - starts (np.ndarray): Offset of the first value of each segment.
+    """
+    codes, epochs = pd.factorize(exploded['epoch'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    values = exploded[column].to_numpy(dtype=float)[order]
+    counts = np.bincount(codes, minlength=len(epochs))
+    starts = np.cumsum(counts) - counts
+    return pd.Index(epochs, name='epoch'), values, starts
+
+
+def epoch_spans(DataSet):
+    """
+    Start and end time of every visible epoch, from the R-tops that belong to it.
+
+    Args:
+        DataSet: An object containing RTops data and epoch-related metadata (see `explode`).
+
+    Returns:
+        pd.DataFrame: Index 'epoch', columns 'start' and 'end' (s), sorted by start time.
+    """
+    exploded = explode(DataSet)
+    spans = exploded.groupby('epoch')['time'].agg(start='min', end='max')
+    return spans.sort_values('start')
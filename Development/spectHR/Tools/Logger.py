@@ -1,4 +1,3 @@
-import ipywidgets as widgets
 import logging
 import sys  # Needed for flushing output
 
@@ -25,15 +24,28 @@ class OutputWidgetHandler(logging.Handler):
         """
         Initializes the OutputWidgetHandler.
 
-        Creates an `ipywidgets.Output` widget to display logs with a custom layout.
+        The `ipywidgets.Output` widget to display logs in is created lazily, see `out`.
         """
         super(OutputWidgetHandler, self).__init__(*args, **kwargs)
-        layout = {
-            'width': '100%',  # Full-width display for the widget
-            'height': '160px',  # Set a fixed height for better visualization
-            'border': '1px solid black'  # Adds a visible border around the widget
-        }
-        self.out = widgets.Output(layout=layout)
+        self._out = None
+
+    @property
+    def out(self):
+        """
+        The `ipywidgets.Output` widget holding the log messages.
+
+        The widget (and with it ipywidgets) is only created on first use, so importing
+        the logger stays cheap in compute-only processes.
+        """
+        if self._out is None:
+            import ipywidgets as widgets
+            layout = {
+                'width': '100%',  # Full-width display for the widget
+                'height': '160px',  # Set a fixed height for better visualization
+                'border': '1px solid black'  # Adds a visible border around the widget
+            }
+            self._out = widgets.Output(layout=layout)
+        return self._out
 
     def emit(self, record):
         """
@@ -44,6 +56,10 @@ class OutputWidgetHandler(logging.Handler):
         """
         # Format the log record into a readable string
         formatted_record = self.format(record)
+        # Outside a Jupyter kernel (e.g. batch workers) there is no widget to show
+        if self._out is None and 'ipykernel' not in sys.modules:
+            print(formatted_record)
+            return
         # Redirect the formatted log message to the output widget
         with self.out:
             print(formatted_record)
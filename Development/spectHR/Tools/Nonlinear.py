@@ -0,0 +1,129 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.spatial import cKDTree
+
+
+def _log_scales(low, high, num=10):
+    """Integer, (roughly) logarithmically spaced box sizes between low and high."""
+    return np.unique(np.round(np.logspace(np.log10(low), np.log10(high), num)).astype(int))
+
+
+def _fluctuation(profile, n):
+    """
+    Root-mean-square fluctuation of the linearly detrended profile in boxes of size n.
+
+    The profile is cut into non-overlapping boxes from the start and from the end (so no
+    data is discarded) and all boxes are detrended at once with the closed-form least
+    squares fit: the residual variance of a box is var(y) - slope**2 * var(t).
+    """
+    k = len(profile) // n
+    boxes = np.concatenate((profile[:k * n].reshape(k, n),
+                            profile[len(profile) - k * n:].reshape(k, n)))
+    t = np.arange(n) - (n - 1) / 2
+    centered = boxes - boxes.mean(axis=1, keepdims=True)
+    slope = centered @ t / np.dot(t, t)
+    residual = np.mean(centered ** 2, axis=1) - slope ** 2 * np.dot(t, t) / n
+    return np.sqrt(np.mean(np.maximum(residual, 0)))
+
+
+def dfa(ibi, short=(4, 16), long=(16, 64)):
+    """
+    Detrended Fluctuation Analysis: the short- and long-term scaling exponents α1 and α2.
+
+    The integrated (cumulative sum) profile is built once; the fluctuation at each of the
+    logarithmically spaced box sizes is then a reshape plus a vectorized linear detrend,
+    so the total cost is O(n) per scale instead of a fit per box.
+
+    Args:
+        ibi (list or array): Inter-beat intervals (IBIs) in seconds.
+        short (tuple, optional): Box size range (beats) for α1. Defaults to (4, 16).
+        long (tuple, optional): Box size range (beats) for α2. Defaults to (16, 64).
+
+    Returns:
+        tuple: (alpha1, alpha2). NaN when the series is too short for at least two box sizes
+            of a range (each box size needs two boxes).
+    """
+    x = np.asarray(ibi, dtype=float)
+    x = x[np.isfinite(x)]
+    profile = np.cumsum(x - x.mean()) if len(x) else x
+
+    def exponent(low, high):
+        scales = _log_scales(low, high)
+        scales = scales[len(x) // scales >= 2]
+        if len(scales) < 2:
+            return np.nan
+        fluctuation = np.array([_fluctuation(profile, n) for n in scales])
+        if np.any(fluctuation <= 0):
+            return np.nan
+        return np.polyfit(np.log(scales), np.log(fluctuation), 1)[0]
+
+    return exponent(*short), exponent(*long)
+
+
+def _tolerance(x, r):
+    return r * np.std(x)
+
+
+def sample_entropy(ibi, m=2, r=0.2):
+    """
+    Sample entropy (SampEn) of an IBI series.
+
+    Template matches are counted with a KD-tree under the Chebyshev (max) norm, which
+    avoids the O(n²) comparison of all template pairs.
+
+    Args:
+        ibi (list or array): Inter-beat intervals (IBIs) in seconds.
+        m (int, optional): Embedding dimension (template length). Defaults to 2.
+        r (float, optional): Tolerance as a fraction of the standard deviation. Defaults to 0.2.
+
+    Returns:
+        float: -log(A / B), with B and A the number of matching template pairs of length m
+            and m + 1. NaN when the series is too short or no matches are found.
+    """
+    x = np.asarray(ibi, dtype=float)
+    x = x[np.isfinite(x)]
+    n = len(x) - m
+    if n < 2:
+        return np.nan
+    tol = _tolerance(x, r)
+
+    def matches(length):
+        tree = cKDTree(sliding_window_view(x, length)[:n])
+        # count_neighbors counts ordered pairs, including every template with itself
+        return tree.count_neighbors(tree, tol, p=np.inf) - n
+
+    b = matches(m)
+    a = matches(m + 1)
+    if a == 0 or b == 0:
+        return np.nan
+    return -np.log(a / b)
+
+
+def approximate_entropy(ibi, m=2, r=0.2):
+    """
+    Approximate entropy (ApEn) of an IBI series.
+
+    The per-template match counts (self-matches included) are obtained with KD-tree ball
+    queries under the Chebyshev (max) norm.
+
+    Args:
+        ibi (list or array): Inter-beat intervals (IBIs) in seconds.
+        m (int, optional): Embedding dimension (template length). Defaults to 2.
+        r (float, optional): Tolerance as a fraction of the standard deviation. Defaults to 0.2.
+
+    Returns:
+        float: Φm - Φm+1. NaN when the series is too short.
+    """
+    x = np.asarray(ibi, dtype=float)
+    x = x[np.isfinite(x)]
+    if len(x) <= m + 1:
+        return np.nan
+    tol = _tolerance(x, r)
+
+    def phi(length):
+        templates = sliding_window_view(x, length)
+        tree = cKDTree(templates)
+        counts = tree.query_ball_point(templates, tol, p=np.inf, return_length=True)
+        return np.mean(np.log(counts / len(templates)))
+
+    return phi(m) - phi(m + 1)
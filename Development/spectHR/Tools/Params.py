@@ -1,5 +1,4 @@
 import numpy as np
-import pyhrv
 
 def sd1(ibi):
     """
@@ -77,6 +76,7 @@ def sdsd(ibi):
         float: The SDSD value, representing the variability in the successive differences of IBIs.
     """
     try:
+        import pyhrv
         ret = pyhrv.time_domain.sdsd(np.asarray(ibi))[0]
     except Exception as e:
         # If calculation fails, return NaN
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, csd, sosfiltfilt
+from spectHR.Tools.Explode import epoch_spans
+from spectHR.Tools.Spectrogram import rtops_fingerprint
+from spectHR.Tools.Logger import logger
+from spectHR.DataSet.SpectHRDataset import TimeSeries
+
+# Physiological breathing band (Hz): 3 - 60 breaths per minute
+BREATHING_BAND = (0.05, 1.0)
+
+
+def edr(DataSet, fs=4, source='amplitude'):
+    """
+    ECG-derived respiration (EDR) from the beat-to-beat R amplitude or QRS area.
+
+    Breathing changes the position of the heart relative to the electrodes, so the R-top
+    amplitude and QRS area (kept in RTops by `calcPeaks`) follow the breathing cycle. The
+    per-beat series is interpolated onto a uniform grid with a single `np.interp` call.
+
+    Args:
+        DataSet: A SpectHRDataset with RTops containing 'time' and the `source` column.
+        fs (float, optional): Sampling frequency of the EDR signal in Hz. Defaults to 4.
+        source (str, optional): 'amplitude' (default) or 'qrs_area'.
+
+    Returns:
+        TimeSeries: The EDR signal, usable wherever the breathing channel (`br`) is.
+    """
+    if source not in DataSet.RTops.columns:
+        raise ValueError(f"RTops has no '{source}' column; rerun calcPeaks to derive respiration from the ECG")
+    beats = DataSet.RTops.dropna(subset=['time', source]).sort_values('time')
+    time = beats['time'].to_numpy(dtype=float)
+    grid = np.arange(time[0], time[-1], 1 / fs)
+    return TimeSeries(grid, np.interp(grid, time, beats[source].to_numpy(dtype=float)), srate=fs)
+
+
+def respiration_signal(DataSet, fs=4, source='amplitude'):
+    """
+    The breathing channel if the dataset has one, otherwise the ECG-derived respiration.
+    """
+    if getattr(DataSet, 'br', None) is not None:
+        return DataSet.br
+    return edr(DataSet, fs, source)
+
+
+def align_respiration(DataSet, fs=4, band=BREATHING_BAND, source='amplitude'):
+    """
+    Puts the breathing signal and the tachogram on one shared uniform time grid.
+
+    The breathing signal is band-pass filtered (zero phase) at its own sampling rate and
+    then interpolated onto the grid, together with the IBI series. The grid covers the
+    time where both signals exist. The result is cached on the dataset (keyed on `fs`,
+    `band` and a fingerprint of the R-tops), so all epochs and all later calls reuse it.
+
+    Without a breathing channel the ECG-derived respiration (`edr`) is used instead.
+
+    Args:
+        DataSet: A SpectHRDataset with RTops and, optionally, a breathing channel (`br`).
+        fs (float, optional): Grid sampling frequency in Hz. Defaults to 4.
+        band (tuple, optional): Pass band (Hz) of the breathing filter. Defaults to 0.05-1 Hz.
+        source (str, optional): EDR source when there is no breathing channel. Defaults to 'amplitude'.
+
+    Returns:
+        pd.DataFrame: Columns time (s), resp (filtered breathing signal) and ibi (s).
+    """
+    br = respiration_signal(DataSet, fs, source)
+    key = (fs, band, rtops_fingerprint(DataSet), len(br.time) if br is DataSet.br else source)
+    cache = getattr(DataSet, 'respiration_cache', None)
+    if cache is not None and cache[0] == key:
+        return cache[1]
+
+    br_time = br.time.to_numpy(dtype=float)
+    br_level = br.level.to_numpy(dtype=float)
+    sos = butter(2, band, btype='bandpass', fs=br.srate, output='sos')
+    filtered = sosfiltfilt(sos, br_level - np.nanmean(br_level))
+
+    rtops = DataSet.RTops.dropna(subset=['ibi']).sort_values('time')
+    rtop_time = rtops['time'].to_numpy(dtype=float)
+    t0 = max(br_time[0], rtop_time[0])
+    t1 = min(br_time[-1], rtop_time[-1])
+    grid = np.arange(t0, t1, 1 / fs)
+
+    aligned = pd.DataFrame({
+        'time': grid,
+        'resp': np.interp(grid, br_time, filtered),
+        'ibi': np.interp(grid, rtop_time, rtops['ibi'].to_numpy(dtype=float)),
+    })
+    DataSet.respiration_cache = (key, aligned)
+    return aligned
+
+
+def detect_breaths(time, resp, min_amplitude=0.3):
+    """
+    Detects breaths as upward zero crossings of a band-passed breathing signal.
+
+    All crossings are found at once; the peak-to-trough amplitude of every candidate cycle
+    is a segmented max/min (`np.maximum.reduceat`). Cycles smaller than `min_amplitude`
+    times the median amplitude are noise: their starting crossing is dropped, which merges
+    them with the previous cycle.
+
+    Args:
+        time (array-like): Sample times (s) on a uniform grid.
+        resp (array-like): Zero-mean, band-passed breathing signal.
+        min_amplitude (float, optional): Relative amplitude threshold. Defaults to 0.3.
+
+    Returns:
+        np.ndarray: Breath onset times (s), linearly interpolated between samples.
+            Consecutive onsets delimit one breathing cycle.
+    """
+    time = np.asarray(time, dtype=float)
+    resp = np.asarray(resp, dtype=float)
+    crossings = np.flatnonzero((resp[:-1] < 0) & (resp[1:] >= 0))
+    if len(crossings) < 2:
+        return np.array([])
+
+    # Peak-to-trough amplitude of every cycle between consecutive crossings
+    amplitude = (np.maximum.reduceat(resp, crossings) - np.minimum.reduceat(resp, crossings))[:-1]
+    keep = np.append(amplitude >= min_amplitude * np.median(amplitude), True)
+    keep[0] = True
+    crossings = crossings[keep]
+
+    # Sub-sample onset time by linear interpolation of the crossing
+    fraction = -resp[crossings] / (resp[crossings + 1] - resp[crossings])
+    return time[crossings] + fraction * (time[crossings + 1] - time[crossings])
+
+
+def respiration(DataSet, fs=4, nperseg=128, noverlap=64, min_amplitude=0.3, source='amplitude'):
+    """
+    Breathing rate, RSA and IBI-respiration coherence of every visible epoch.
+
+    The breathing signal and tachogram are aligned once (`align_respiration`) and breaths
+    are detected once over the whole recording (`detect_breaths`); the epochs are then
+    slices of the shared grid:
+
+    - breathing_rate: 60 / mean cycle duration of the cycles starting in the epoch (per min).
+    - rsa: peak-valley RSA, the mean over cycles of max(IBI) - min(IBI) within a breathing
+      cycle (ms), evaluated as a segmented max/min over all cycles at once.
+    - coherence_hf and coherence_resp: magnitude-squared coherence between tachogram and
+      breathing, averaged over the HF band and taken at the dominant breathing frequency
+      (resp_freq). The Welch segments of all epochs are stacked into one `csd` call.
+
+    Sessions without a breathing belt (`br` is None) use the ECG-derived respiration.
+
+    Args:
+        DataSet: A SpectHRDataset with RTops, epochs and optionally a breathing channel (`br`).
+        fs (float, optional): Grid sampling frequency in Hz. Defaults to 4.
+        nperseg (int, optional): Coherence segment length in samples (32 s). Defaults to 128.
+        noverlap (int, optional): Coherence segment overlap in samples. Defaults to 64.
+        min_amplitude (float, optional): Relative breath amplitude threshold. Defaults to 0.3.
+        source (str, optional): EDR source ('amplitude' or 'qrs_area') without `br`.
+
+    Returns:
+        pd.DataFrame: One row per epoch (index 'epoch') with the columns breaths,
+            breathing_rate, resp_freq, rsa, coherence_hf and coherence_resp.
+    """
+    aligned = align_respiration(DataSet, fs, source=source)
+    time = aligned['time'].to_numpy()
+    resp = aligned['resp'].to_numpy()
+    ibi = aligned['ibi'].to_numpy()
+    spans = epoch_spans(DataSet)
+
+    # Breath cycles of the whole recording, as grid index ranges [first, last)
+    onsets = detect_breaths(time, resp, min_amplitude)
+    cycle_start, cycle_end = onsets[:-1], onsets[1:]
+    first = np.searchsorted(time, cycle_start)
+    last = np.maximum(np.searchsorted(time, cycle_end), first + 1)
+    bounds = np.column_stack((first, last)).ravel()
+    if len(bounds) and bounds[-1] >= len(ibi):
+        bounds[-1] = len(ibi) - 1
+    rsa = np.array([])
+    if len(bounds):
+        rsa = 1000 * (np.maximum.reduceat(ibi, bounds)[::2] - np.minimum.reduceat(ibi, bounds)[::2])
+
+    # Cycles per epoch: those starting inside it (and ending before its end)
+    c0 = np.searchsorted(cycle_start, spans['start'].to_numpy(), side='left')
+    c1 = np.searchsorted(cycle_end, spans['end'].to_numpy(), side='right')
+    c1 = np.maximum(c1, c0)
+    count = c1 - c0
+
+    def cycle_sum(values):
+        prefix = np.concatenate(([0.0], np.cumsum(values)))
+        return prefix[c1] - prefix[c0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = pd.DataFrame({
+            'breaths': count,
+            'breathing_rate': 60 * count / cycle_sum(cycle_end - cycle_start),
+            'rsa': cycle_sum(rsa) / count,
+        }, index=spans.index)
+
+    result = result.join(_coherence(time, resp, ibi, spans, fs, nperseg, noverlap))
+    logger.info(f"Respiration: {len(onsets)} breaths detected")
+    return result[['breaths', 'breathing_rate', 'resp_freq', 'rsa', 'coherence_hf', 'coherence_resp']]
+
+
+def _coherence(time, resp, ibi, spans, fs, nperseg, noverlap, band=(0.15, 0.4)):
+    """
+    Magnitude-squared coherence of the tachogram and breathing signal for all epochs.
+
+    The Welch segments of all epochs are cut from the shared grid and stacked, so one
+    `csd` call gives the (cross) periodograms of every segment; they are averaged per
+    epoch with `np.add.reduceat`. Epochs with fewer than two segments give NaN.
+    """
+    g0 = np.searchsorted(time, spans['start'].to_numpy())
+    g1 = np.searchsorted(time, spans['end'].to_numpy(), side='right')
+    step = nperseg - noverlap
+    counts = np.where(g1 - g0 >= nperseg, (g1 - g0 - nperseg) // step + 1, 0)
+    counts[counts < 2] = 0  # the coherence of a single segment is always 1
+    columns = ['resp_freq', 'coherence_hf', 'coherence_resp']
+    result = pd.DataFrame(np.nan, index=spans.index, columns=columns)
+    if counts.sum() == 0:
+        return result
+
+    first = np.cumsum(counts) - counts
+    seg_starts = np.repeat(g0, counts) + step * (np.arange(counts.sum()) - np.repeat(first, counts))
+    rows = seg_starts[:, None] + np.arange(nperseg)
+    x, y = ibi[rows], resp[rows]
+
+    def averaged(a, b):
+        freqs, p = csd(a, b, fs=fs, nperseg=nperseg, noverlap=0, window='hann', axis=-1)
+        has = counts > 0
+        return freqs, np.add.reduceat(p, first[has], axis=0) / counts[has, None]
+
+    freqs, pxy = averaged(x, y)
+    _, pxx = averaged(x, x)
+    _, pyy = averaged(y, y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coherence = np.abs(pxy) ** 2 / (pxx.real * pyy.real)
+
+    hf = (freqs >= band[0]) & (freqs <= band[1])
+    breathing = (freqs >= BREATHING_BAND[0]) & (freqs <= BREATHING_BAND[1])
+    peak = np.flatnonzero(breathing)[np.argmax(pyy.real[:, breathing], axis=1)]
+    has = counts > 0
+    result.loc[has, 'resp_freq'] = freqs[peak]
+    result.loc[has, 'coherence_hf'] = np.nanmean(coherence[:, hf], axis=1)
+    result.loc[has, 'coherence_resp'] = coherence[np.arange(len(peak)), peak]
+    return result
@@ -0,0 +1,102 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.signal import periodogram
+from spectHR.Tools.Spectrum import band_powers, resample_ibi
+from spectHR.Tools.Logger import logger
+
+
+def band_power_timecourse(times, ibi, fs=4, nperseg=256, noverlap=224, nfft=2**10, window='hamming', chunk=512):
+    """
+    Short-time Fourier analysis of an IBI series: band powers over time.
+
+    The IBI series is resampled once onto the 4 Hz tachogram (as in `welch_psd`). Windows of
+    `nperseg` samples advance by `nperseg - noverlap` samples; each window gives one
+    (detrended, windowed) periodogram, which is immediately reduced to its band powers.
+    The windows are processed in blocks of `chunk`, so memory stays fixed at roughly
+    chunk * (nperseg + nfft / 2) values however long the recording is.
+
+    Args:
+        times (array-like): R-top times (s), ascending.
+        ibi (array-like): IBIs (s) belonging to these times.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+        nperseg (int, optional): Window length in samples (64 s at 4 Hz). Defaults to 256.
+        noverlap (int, optional): Window overlap in samples (8 s steps at 4 Hz). Defaults to 224.
+        nfft (int, optional): FFT length. Defaults to 1024.
+        window (str, optional): Window function. Defaults to 'hamming'.
+        chunk (int, optional): Number of windows per block. Defaults to 512.
+
+    Returns:
+        pd.DataFrame: One row per window with the columns time (window center, s),
+            'VLF Power', 'LF Power', 'HF Power' and 'LF/HF Ratio'. The VLF band is not
+            resolved by short windows and is reported for completeness only.
+    """
+    times = np.asarray(times, dtype=float)
+    ibi = np.asarray(ibi, dtype=float)
+    valid = np.isfinite(times) & np.isfinite(ibi)
+    columns = ['time', 'VLF Power', 'LF Power', 'HF Power', 'LF/HF Ratio']
+    if valid.sum() < 2:
+        return pd.DataFrame(columns=columns)
+
+    t0, tachogram = resample_ibi(times[valid], ibi[valid], fs)
+    step = nperseg - noverlap
+    n_windows = (len(tachogram) - nperseg) // step + 1 if len(tachogram) >= nperseg else 0
+    window_starts = np.arange(n_windows) * step
+
+    blocks = []
+    for first in range(0, n_windows, chunk):
+        starts = window_starts[first:first + chunk]
+        segments = tachogram[starts[:, None] + np.arange(nperseg)]
+        freqs, psd = periodogram(segments, fs=fs, window=window, nfft=nfft, detrend='constant',
+                                 scaling='density', axis=-1)
+        blocks.append(pd.DataFrame(band_powers(freqs, psd)))
+
+    course = pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame(columns=columns[1:])
+    course.insert(0, 'time', t0[0] + (window_starts + nperseg / 2) / fs if n_windows else [])
+    return course
+
+
+def rtops_fingerprint(DataSet):
+    """
+    Identifies the current R-tops, used to invalidate cached results after edits: the
+    dataset's `rtops_version`, or else a short hash of the R-top times and IBIs.
+    """
+    version = getattr(DataSet, 'rtops_version', None)
+    if version is not None:
+        return version
+    digest = hashlib.sha1()
+    for column in ('time', 'ibi'):
+        digest.update(DataSet.RTops[column].to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def spectrogram(DataSet, fs=4, nperseg=256, noverlap=224, nfft=2**10, window='hamming'):
+    """
+    Band-power time course of the whole recording, cached on the dataset.
+
+    Results are kept in `DataSet.spectrogram_cache`, keyed on the parameters and on the
+    version of the RTops (see `rtops_fingerprint`). Asking again with the same parameters
+    (e.g. re-opening the PSD tab) is a dictionary lookup; editing the R-tops invalidates
+    the cache. The cache lives for this session only: `save` does not pickle it.
+
+    Args:
+        DataSet: A SpectHRDataset with an RTops DataFrame containing 'time' and 'ibi'.
+        fs, nperseg, noverlap, nfft, window: See `band_power_timecourse`.
+
+    Returns:
+        pd.DataFrame: The band-power time course (see `band_power_timecourse`).
+    """
+    fingerprint = rtops_fingerprint(DataSet)
+    key = (fs, nperseg, noverlap, nfft, window)
+
+    cache = getattr(DataSet, 'spectrogram_cache', None)
+    if cache is None or cache.get('fingerprint') != fingerprint:
+        # R-tops changed (or no cache yet): every stored time course is stale
+        cache = {'fingerprint': fingerprint, 'results': {}}
+        DataSet.spectrogram_cache = cache
+
+    if key not in cache['results']:
+        rtops = DataSet.RTops.sort_values('time')
+        cache['results'][key] = band_power_timecourse(rtops['time'], rtops['ibi'], fs, nperseg, noverlap, nfft, window)
+        logger.info(f"Spectrogram computed: {len(cache['results'][key])} windows")
+    return cache['results'][key]
@@ -0,0 +1,324 @@
+import numpy as np
+import pandas as pd
+from scipy.integrate import trapezoid
+from scipy.interpolate import interp1d
+from scipy.signal import welch
+from spectHR.Tools.Explode import explode, epoch_segments
+
+# Frequency bands of interest for HRV analysis (Hz)
+BANDS = {
+    'VLF': (0.003, 0.04),  # Very Low Frequency
+    'LF': (0.04, 0.15),    # Low Frequency
+    'HF': (0.15, 0.4),     # High Frequency
+}
+
+
+def band_power(freqs, psd, band):
+    """
+    Computes the power within a frequency band using the trapezoidal rule.
+
+    Works on a single spectrum or on a stack of spectra (one per row) at once.
+
+    Args:
+        freqs (np.ndarray): Frequency values (Hz).
+        psd (np.ndarray): PSD values along the last axis, matching `freqs`.
+        band (tuple): (f_low, f_high) defining the frequency range.
+
+    Returns:
+        float or np.ndarray: Power within the band, one value per spectrum.
+    """
+    idx = np.logical_and(freqs >= band[0], freqs <= band[1])
+    return trapezoid(np.asarray(psd)[..., idx], freqs[idx], axis=-1)
+
+
+def resample_ibi(ibi_times, ibi_values, fs=4, kind='linear'):
+    """
+    Interpolates an IBI series onto a uniform time grid (the tachogram).
+
+    Args:
+        ibi_times (array-like): R-top times (s).
+        ibi_values (array-like): IBIs (s) belonging to these times.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+        kind (str, optional): Interpolation kind passed to `interp1d`. Defaults to 'linear'.
+
+    Returns:
+        tuple: (time_uniform, ibi_resampled) as arrays.
+    """
+    ibi_times = np.asarray(ibi_times, dtype=float)
+    time_uniform = np.arange(ibi_times[0], ibi_times[-1], 1 / fs)  # Regular time grid at fs Hz
+    interp_func = interp1d(ibi_times, np.asarray(ibi_values, dtype=float), kind=kind, fill_value='extrapolate')
+    return time_uniform, interp_func(time_uniform)
+
+
+def lombscargle_psd(times, values, starts, freqs, max_elements=2 ** 22):
+    """
+    Lomb-Scargle PSD of one or more unevenly sampled series on a shared frequency grid.
+
+    The series are concatenated, with `starts` marking where each one begins (as returned
+    by `epoch_segments`). All trigonometric sums of the classic (time-shift invariant)
+    Lomb-Scargle periodogram are evaluated for all series at once as a (frequency, sample)
+    matrix reduced per series with `np.add.reduceat`. The frequency axis is processed in
+    chunks so that the matrix never exceeds `max_elements` entries. No resampling is needed.
+
+    The periodogram is scaled to a one-sided density (units of values² / Hz), so that band
+    powers are comparable with those of `welch`.
+
+    Args:
+        times (array-like): Sample times (s) of all series, ascending within each series.
+        values (array-like): Sample values (e.g. IBIs in s) of all series.
+        starts (array-like): Offset of the first sample of each series.
+        freqs (array-like): Shared frequency grid (Hz), excluding 0.
+        max_elements (int, optional): Memory bound of the intermediate matrices.
+
+    Returns:
+        np.ndarray: (n_series, n_freqs) PSD. Series with fewer than 3 samples are NaN.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    starts = np.asarray(starts)
+    freqs = np.asarray(freqs, dtype=float)
+    n = np.diff(np.append(starts, len(times)))
+
+    # Center every series and shift it to start at t=0 (the periodogram is shift invariant)
+    y = values - np.repeat(np.add.reduceat(values, starts) / n, n)
+    t = times - np.repeat(times[starts], n)
+    duration = np.maximum.reduceat(t, starts)
+
+    psd = np.empty((len(starts), len(freqs)))
+    chunk = max(1, max_elements // max(1, len(t)))
+    for f0 in range(0, len(freqs), chunk):
+        omega = 2 * np.pi * freqs[f0:f0 + chunk, None]
+        wt = omega * t
+        cos, sin = np.cos(wt), np.sin(wt)
+
+        def segment_sum(x):
+            return np.add.reduceat(x, starts, axis=1).T
+
+        c, s = segment_sum(y * cos), segment_sum(y * sin)
+        cc, ss, cs = segment_sum(cos * cos), segment_sum(sin * sin), segment_sum(cos * sin)
+        # Phase offset tau that decouples the sine and cosine terms: tan(2wt) = 2CS / (CC - SS)
+        two_tau = np.arctan2(2 * cs, cc - ss)
+        ct, st = np.cos(two_tau / 2), np.sin(two_tau / 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            power = 0.5 * ((c * ct + s * st) ** 2 / (cc * ct ** 2 + 2 * cs * ct * st + ss * st ** 2)
+                           + (s * ct - c * st) ** 2 / (ss * ct ** 2 - 2 * cs * ct * st + cc * st ** 2))
+        psd[:, f0:f0 + chunk] = power
+
+    # One-sided density: 2 * P / fs, with fs the mean sampling rate of each series
+    with np.errstate(divide='ignore', invalid='ignore'):
+        psd *= (2 * duration / (n - 1))[:, None]
+    psd[n < 3] = np.nan
+    return psd
+
+
+def burg_psd(times, values, starts, freqs, fs=4, max_order=16):
+    """
+    Autoregressive (Burg) PSD of one or more series, with the model order chosen by AIC.
+
+    The series are resampled onto their fs grids (`resample_segments`) and stacked into one
+    zero-padded (n_series, max_length) matrix with a validity mask. Burg's recursion then
+    runs once for all series: every stage is a masked row-wise reduction for the reflection
+    coefficients, followed by the Levinson update of the AR coefficients. The order with the
+    lowest AIC = N ln(E_p) + 2p is kept per series. Unlike Welch, an AR model needs no
+    minimum segment length, so short epochs (60-120 s) still give stable band powers.
+
+    Args:
+        times (array-like): Sample times (s) of all series, ascending within each series.
+        values (array-like): Sample values (e.g. IBIs in s) of all series.
+        starts (array-like): Offset of the first sample of each series.
+        freqs (array-like): Frequency grid (Hz) to evaluate the spectra on.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+        max_order (int, optional): Highest AR order considered. Defaults to 16.
+
+    Returns:
+        tuple: (psd, order): the (n_series, n_freqs) one-sided PSD (values² / Hz) and the
+            selected order per series. Series with fewer than 3 resampled samples are NaN.
+    """
+    _, resampled, grid_starts = resample_segments(times, values, starts, fs)
+    lengths = np.diff(np.append(grid_starts, len(resampled)))
+    n_series, width = len(lengths), max(lengths.max(initial=0), 1)
+
+    # Zero-padded matrix of the mean-removed series, with its validity mask
+    row = np.repeat(np.arange(n_series), lengths)
+    col = np.arange(len(resampled)) - np.repeat(grid_starts, lengths)
+    mask = np.zeros((n_series, width), dtype=bool)
+    mask[row, col] = True
+    x = np.zeros((n_series, width))
+    if len(resampled):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x[row, col] = resampled - np.repeat(np.add.reduceat(resampled, grid_starts) / lengths, lengths)
+
+    max_order = int(max(1, min(max_order, width - 2)))
+    a = np.zeros((n_series, max_order + 1, max_order + 1))  # AR coefficients per order
+    a[:, :, 0] = 1
+    error = np.empty((n_series, max_order + 1))
+    error[:, 0] = np.sum(x ** 2, axis=1) / np.maximum(lengths, 1)
+
+    f, b = x.copy(), x.copy()
+    for p in range(1, max_order + 1):
+        fp, bp = f[:, 1:], b[:, :-1]
+        valid = mask[:, p:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = -2 * np.sum(fp * bp * valid, axis=1) / np.sum((fp ** 2 + bp ** 2) * valid, axis=1)
+        k = np.nan_to_num(k)
+        f, b = (fp + k[:, None] * bp) * valid, (bp + k[:, None] * fp) * valid
+
+        # Levinson update: a_p = a_{p-1} + k * reversed(a_{p-1})
+        previous = a[:, p - 1, :p + 1]
+        a[:, p, :p + 1] = previous + k[:, None] * previous[:, ::-1]
+        error[:, p] = error[:, p - 1] * (1 - k ** 2)
+
+    # Order selection by AIC; orders the series is too short for are excluded
+    orders = np.arange(max_order + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aic = lengths[:, None] * np.log(error) + 2 * orders
+    aic[(orders[None, :] >= lengths[:, None] - 1) | ~np.isfinite(aic)] = np.inf
+    aic[:, 0] = np.inf
+    order = np.argmin(aic, axis=1)
+    coefficients = a[np.arange(n_series), order]
+
+    # P(f) = 2 * E_p / (fs * |A(f)|²), one-sided
+    freqs = np.asarray(freqs, dtype=float)
+    basis = np.exp(-2j * np.pi * np.outer(freqs, np.arange(max_order + 1)) / fs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        psd = 2 * error[np.arange(n_series), order][:, None] / fs / np.abs(coefficients @ basis.T) ** 2
+    psd[lengths < 3] = np.nan
+    return psd, order
+
+
+def band_powers(freqs, psd):
+    """
+    Computes the VLF, LF and HF power and the LF/HF ratio of one or more spectra.
+
+    Args:
+        freqs (np.ndarray): Frequency values (Hz).
+        psd (np.ndarray): One spectrum, or a stack of spectra (one per row).
+
+    Returns:
+        dict: 'VLF Power', 'LF Power', 'HF Power' and 'LF/HF Ratio', one value per spectrum.
+    """
+    powers = {f'{name} Power': band_power(freqs, psd, band) for name, band in BANDS.items()}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        powers['LF/HF Ratio'] = powers['LF Power'] / powers['HF Power']  # sympathovagal balance
+    return powers
+
+
+def resample_segments(times, values, starts, fs=4):
+    """
+    Linearly interpolates concatenated series onto their own uniform grids in one call.
+
+    Every series j is resampled on np.arange(t0_j, tlast_j, 1/fs). To do all series with a
+    single `np.interp`, series j (and its grid) is shifted by j times a span larger than
+    any series, which makes the concatenation monotonic.
+
+    Args:
+        times (array-like): Sample times (s) of all series, ascending within each series.
+        values (array-like): Sample values of all series.
+        starts (array-like): Offset of the first sample of each series.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+
+    Returns:
+        tuple: (grid, resampled, grid_starts): the concatenated uniform times and values,
+            and the offset of each series in them.
+    """
+    times = np.asarray(times, dtype=float)
+    starts = np.asarray(starts)
+    n = np.diff(np.append(starts, len(times)))
+    t0 = times[starts]
+    lengths = np.maximum(np.ceil((times[starts + n - 1] - t0) * fs).astype(int), 0)
+    grid_starts = np.cumsum(lengths) - lengths
+
+    grid = np.repeat(t0, lengths) + (np.arange(lengths.sum()) - np.repeat(grid_starts, lengths)) / fs
+    span = 2 * (times.max() - times.min()) + 1 if len(times) else 0
+    shift = np.arange(len(starts)) * span
+    resampled = np.interp(grid + np.repeat(shift, lengths), times + np.repeat(shift, n), values)
+    return grid, resampled, grid_starts
+
+
+def welch_segments(times, values, starts, fs=4, nperseg=256, noverlap=128, nfft=2**12, window='hamming'):
+    """
+    Welch PSD of many series with a single `welch` call.
+
+    All series are resampled at once (`resample_segments`), cut into their Welch segments
+    (`nperseg` long, `noverlap` overlap), and the segments of all series are stacked into
+    one 2-D array. A single `welch` call then returns a periodogram per row, which is
+    averaged per series with `np.add.reduceat`. The result equals running `welch` on every
+    resampled series separately.
+
+    Args:
+        times (array-like): Sample times (s) of all series, ascending within each series.
+        values (array-like): Sample values (e.g. IBIs in s) of all series.
+        starts (array-like): Offset of the first sample of each series.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+        nperseg (int, optional): Segment length in samples. Defaults to 256.
+        noverlap (int, optional): Overlap between segments in samples. Defaults to 128.
+        nfft (int, optional): FFT length. Defaults to 4096.
+        window (str, optional): Window function. Defaults to 'hamming'.
+
+    Returns:
+        tuple: (freqs, psd) with psd of shape (n_series, n_freqs). Series shorter than
+            `nperseg` samples give NaN rows.
+    """
+    _, resampled, grid_starts = resample_segments(times, values, starts, fs)
+    lengths = np.diff(np.append(grid_starts, len(resampled)))
+    step = nperseg - noverlap
+    counts = np.where(lengths >= nperseg, (lengths - nperseg) // step + 1, 0)
+
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+    psd = np.full((len(lengths), len(freqs)), np.nan)
+    if counts.sum() == 0:
+        return freqs, psd
+
+    first = np.cumsum(counts) - counts
+    segment_starts = np.repeat(grid_starts, counts) + step * (np.arange(counts.sum()) - np.repeat(first, counts))
+    segments = resampled[segment_starts[:, None] + np.arange(nperseg)]
+
+    freqs, periodograms = welch(segments, fs=fs, scaling='density', nfft=nfft, nperseg=nperseg,
+                                noverlap=0, window=window, axis=-1)
+    has_segments = counts > 0
+    psd[has_segments] = np.add.reduceat(periodograms, first[has_segments], axis=0) / counts[has_segments, None]
+    return freqs, psd
+
+
+def epoch_psd(DataSet, engine='welch', fs=4, nperseg=256, noverlap=128, nfft=2**12, window='hamming', max_order=16):
+    """
+    Computes the spectra and band powers of all visible epochs in one batched call.
+
+    This is the computational half of `welch_psd`, without any plotting: all epochs are
+    handled together, by `welch_segments` (one `welch` call for all segments of all epochs),
+    by `lombscargle_psd` (one shared frequency grid, no resampling) or by `burg_psd` (one
+    masked Burg recursion over all epochs; also works for epochs shorter than `nperseg`).
+
+    Args:
+        DataSet: A SpectHRDataset with RTops and epoch information (see `explode`).
+        engine (str, optional): 'welch' (default), 'lombscargle' or 'burg'.
+        fs (float, optional): Resampling frequency in Hz. Defaults to 4.
+        nperseg (int, optional): Welch segment length in samples. Defaults to 256.
+        noverlap (int, optional): Welch segment overlap in samples. Defaults to 128.
+        nfft (int, optional): FFT length; also sets the Lomb-Scargle grid. Defaults to 4096.
+        window (str, optional): Welch window function. Defaults to 'hamming'.
+        max_order (int, optional): Highest AR order for the Burg engine. Defaults to 16.
+
+    Returns:
+        tuple:
+            - freqs (np.ndarray): The shared frequency grid (Hz).
+            - psd (np.ndarray): (n_epochs, n_freqs) PSD in s²/Hz, rows ordered as `powers`.
+            - powers (pd.DataFrame): Band powers and LF/HF ratio, indexed by epoch. Epochs
+              that are too short for the engine are NaN.
+    """
+    exploded = explode(DataSet)
+    epochs, ibi, starts = epoch_segments(exploded, 'ibi')
+    _, times, _ = epoch_segments(exploded, 'time')
+
+    if engine == 'welch':
+        freqs, psd = welch_segments(times, ibi, starts, fs, nperseg, noverlap, nfft, window)
+    elif engine == 'lombscargle':
+        freqs = np.arange(1, nfft // 2 + 1) * fs / nfft
+        psd = lombscargle_psd(times, ibi, starts, freqs)
+    elif engine == 'burg':
+        freqs = np.fft.rfftfreq(nfft, 1 / fs)
+        psd, _ = burg_psd(times, ibi, starts, freqs, fs, max_order)
+    else:
+        raise ValueError(f"Unknown spectral engine '{engine}'")
+
+    return freqs, psd, pd.DataFrame(band_powers(freqs, psd), index=epochs)
@@ -1,4 +1,3 @@
-import easywebdav
 import os
 from pathlib import Path
 from spectHR.Tools.Logger import logger
@@ -32,6 +31,7 @@ def initWebdav():
         raise KeyError(f"Missing required environment variable: {e}") from e
 
     # Establish a WebDAV connection
+    import easywebdav
     webdav = easywebdav.connect(
         host='unishare.rug.nl',  # Only the hostname
         username=username,
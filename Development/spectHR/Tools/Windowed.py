@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+
+class WindowedHRV:
+    """
+    HRV metrics over arbitrary time windows of the RTops table, using prefix sums.
+
+    Cumulative sums of the IBIs, the squared IBIs, the instantaneous heart rate and the
+    squared successive differences are built once (O(n)). Any window (t_start, t_end)
+    is then answered with two `searchsorted` lookups and a handful of subtractions, so
+    a complete time course of thousands of windows costs a few vectorized NumPy calls.
+
+    A beat belongs to a window when its R-top time t satisfies t_start <= t < t_end.
+    Successive differences are counted when both beats belong to the window.
+
+    Attributes:
+        time (np.ndarray): Sorted R-top times (s).
+
+    Methods:
+        query(t_start, t_end):
+            Metrics for one or more arbitrary windows.
+        sliding(window=30, step=1, t_start=None, t_end=None):
+            Metrics for equally spaced, possibly overlapping windows.
+    """
+
+    def __init__(self, DataSet):
+        """
+        Precomputes the prefix sums from the RTops of a dataset.
+
+        Args:
+            DataSet: A SpectHRDataset with an RTops DataFrame containing 'time' and 'ibi'.
+        """
+        rtops = DataSet.RTops.sort_values('time')
+        self.time = rtops['time'].to_numpy(dtype=float)
+        ibi = rtops['ibi'].to_numpy(dtype=float)
+
+        valid = np.isfinite(ibi)
+        # Center the IBIs before summing to keep the variance free of cancellation errors
+        self._center = np.mean(ibi[valid]) if valid.any() else 0.0
+        x = np.where(valid, ibi - self._center, 0.0)
+        hr = np.where(valid, 60.0 / np.where(valid, ibi, 1.0), 0.0)
+
+        diff_valid = valid[:-1] & valid[1:]
+        diff = np.where(diff_valid, np.diff(np.where(valid, ibi, 0.0)), 0.0)
+
+        def prefix(values):
+            return np.concatenate(([0.0], np.cumsum(values)))
+
+        self._n = prefix(valid)
+        self._sum = prefix(x)
+        self._sum2 = prefix(x ** 2)
+        self._hr = prefix(hr)
+        self._diff_n = prefix(diff_valid)
+        self._diff2 = prefix(diff ** 2)
+
+    def query(self, t_start, t_end):
+        """
+        Computes the HRV metrics for one or more time windows in O(1) per window.
+
+        Args:
+            t_start (float or array-like): Window start time(s) in seconds.
+            t_end (float or array-like): Window end time(s) in seconds.
+
+        Returns:
+            pd.DataFrame: One row per window with the columns
+                t_start, t_end, N, mean_ibi (s), mean_hr (bpm), sdnn (ms) and rmssd (ms).
+                Windows with too few beats give NaN.
+        """
+        t_start, t_end = np.broadcast_arrays(np.atleast_1d(np.asarray(t_start, dtype=float)),
+                                             np.atleast_1d(np.asarray(t_end, dtype=float)))
+        i0 = np.searchsorted(self.time, t_start, side='left')
+        i1 = np.maximum(np.searchsorted(self.time, t_end, side='left'), i0)
+        # Differences between beat k and k+1 live at index k; both beats must be in the window
+        d1 = np.maximum(i1 - 1, i0)
+
+        n = self._n[i1] - self._n[i0]
+        s1 = self._sum[i1] - self._sum[i0]
+        s2 = self._sum2[i1] - self._sum2[i0]
+        dn = self._diff_n[d1] - self._diff_n[i0]
+        d2 = self._diff2[d1] - self._diff2[i0]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.maximum(s2 - s1 ** 2 / n, 0.0) / (n - 1)
+            return pd.DataFrame({
+                't_start': t_start,
+                't_end': t_end,
+                'N': n.astype(int),
+                'mean_ibi': np.where(n > 0, self._center + s1 / n, np.nan),
+                'mean_hr': np.where(n > 0, (self._hr[i1] - self._hr[i0]) / n, np.nan),
+                'sdnn': np.where(n > 1, 1000 * np.sqrt(var), np.nan),
+                'rmssd': np.where(dn > 0, 1000 * np.sqrt(d2 / dn), np.nan),
+            })
+
+    def sliding(self, window=30, step=1, t_start=None, t_end=None):
+        """
+        Computes a continuous time course of HRV metrics with a sliding window.
+
+        Args:
+            window (float, optional): Window length in seconds. Defaults to 30.
+            step (float, optional): Time between successive window starts. Defaults to 1.
+            t_start (float, optional): Start of the first window. Defaults to the first R-top.
+            t_end (float, optional): Latest allowed window end. Defaults to the last R-top.
+
+        Returns:
+            pd.DataFrame: As `query`, with an additional 'time' column holding the window
+                centers, ready to plot or export.
+        """
+        if len(self.time) == 0:
+            return self.query([], [])
+        t_start = self.time[0] if t_start is None else t_start
+        t_end = self.time[-1] if t_end is None else t_end
+        starts = np.arange(t_start, max(t_end - window, t_start) + step / 2, step)
+        result = self.query(starts, starts + window)
+        result.insert(0, 'time', starts + window / 2)
+        return result
@@ -1,15 +1,79 @@
-from spectHR.ui.LineHandler import LineHandler, DraggableVLine
-from spectHR.Plots.prepPlot import prepPlot
+"""
+spectHR - Cardiovascular Spectral Analysis Toolkit.
 
-from spectHR.Plots.Poincare import poincare
-from spectHR.Plots.Gantt import gantt
-from spectHR.Plots.Welch import welch_psd
+The package namespace is resolved lazily (module-level `__getattr__`): `import spectHR`
+imports nothing but this file, and every public name is imported from its module on
+first access. Compute-only use (e.g. `spectHR.calcPeaks` or `spectHR.descriptives` in a
+batch worker) therefore only loads numpy, scipy and pandas, and never the widget and
+plotting stack (matplotlib, ipywidgets, ipyvuetify, mplcursors) or pyhrv and easywebdav.
+"""
+import importlib
 
-from spectHR.Tools.Logger import logger, handler
-from spectHR.Tools.Webdav import copyWebdav
-from spectHR.Tools.Explode import explode
+# Public name -> module that defines it
+_exports = {
+    'LineHandler': 'spectHR.ui.LineHandler',
+    'DraggableVLine': 'spectHR.ui.LineHandler',
+    'prepPlot': 'spectHR.Plots.prepPlot',
 
-from spectHR.DataSet.SpectHRDataset import SpectHRDataset, TimeSeries
-from spectHR.Actions.csActions import *
-from spectHR.App.spectHRApp import HRApp
-from spectHR.Tools.Params import *
\ No newline at end of file
+    'poincare': 'spectHR.Plots.Poincare',
+    'gantt': 'spectHR.Plots.Gantt',
+    'welch_psd': 'spectHR.Plots.Welch',
+    'plot_psd': 'spectHR.Plots.Welch',
+    'plot_spectrogram': 'spectHR.Plots.Spectrogram',
+
+    'logger': 'spectHR.Tools.Logger',
+    'handler': 'spectHR.Tools.Logger',
+    'copyWebdav': 'spectHR.Tools.Webdav',
+    'explode': 'spectHR.Tools.Explode',
+    'descriptives': 'spectHR.Tools.Descriptives',
+    'WindowedHRV': 'spectHR.Tools.Windowed',
+    'CohortStore': 'spectHR.Tools.CohortStore',
+    'bootstrap_ci': 'spectHR.Tools.Bootstrap',
+    'epoch_psd': 'spectHR.Tools.Spectrum',
+    'spectrogram': 'spectHR.Tools.Spectrogram',
+    'epoch_spans': 'spectHR.Tools.Explode',
+    'epoch_masks': 'spectHR.Tools.Explode',
+    'visible_mask': 'spectHR.Tools.Explode',
+    'respiration': 'spectHR.Tools.Respiration',
+    'edr': 'spectHR.Tools.Respiration',
+    'baroreflex': 'spectHR.Tools.BloodPressure',
+    'beat_pressures': 'spectHR.Tools.BloodPressure',
+
+    'SpectHRDataset': 'spectHR.DataSet.SpectHRDataset',
+    'TimeSeries': 'spectHR.DataSet.SpectHRDataset',
+    'RTopModel': 'spectHR.DataSet.RTopModel',
+    'EditJournal': 'spectHR.DataSet.EditJournal',
+    'AnomalyIndex': 'spectHR.DataSet.AnomalyIndex',
+    'calcPeaks': 'spectHR.Actions.csActions',
+    'filterECGData': 'spectHR.Actions.csActions',
+    'borderData': 'spectHR.Actions.csActions',
+    'classify': 'spectHR.Actions.csActions',
+    'HRApp': 'spectHR.App.spectHRApp',
+    'sd1': 'spectHR.Tools.Params',
+    'sd2': 'spectHR.Tools.Params',
+    'sd_ratio': 'spectHR.Tools.Params',
+    'ellipse_area': 'spectHR.Tools.Params',
+    'sdsd': 'spectHR.Tools.Params',
+}
+
+_subpackages = {'Actions', 'App', 'DataSet', 'Plots', 'Tools', 'ui'}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    """
+    Imports a public name (or subpackage) on first access and caches it in the namespace.
+    """
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name]), name)
+    elif name in _subpackages:
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _subpackages)
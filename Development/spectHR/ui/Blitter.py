@@ -0,0 +1,74 @@
+class Blitter:
+    """
+    Redraws a single moving artist on top of a cached background (blitting).
+
+    While an artist is being dragged, the rest of the figure (ECG trace, R-top lines,
+    arrows, labels) does not change. `start` renders the figure once without the artist
+    and caches the result; every `update` then restores that background and draws only
+    the artist, instead of redrawing the whole figure per mouse event.
+
+    Backends without blitting support fall back to `draw_idle`.
+
+    Attributes:
+        canvas: The Matplotlib canvas being drawn on.
+        artist: The artist that is currently moving, or None.
+    """
+
+    def __init__(self, canvas):
+        """
+        Args:
+            canvas (FigureCanvasBase): The canvas of the figure that holds the moving artists.
+        """
+        self.canvas = canvas
+        self.artist = None
+        self._background = None
+        self._cid = None
+
+    def start(self, artist):
+        """
+        Makes `artist` animated and caches the figure without it.
+
+        Args:
+            artist (matplotlib.artist.Artist): The artist that is about to move.
+        """
+        self.artist = artist
+        if not self.canvas.supports_blit:
+            return
+        artist.set_animated(True)
+        self._cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.draw()  # triggers _on_draw, which caches the background
+        self.update()
+
+    def update(self):
+        """
+        Redraws only the moving artist over the cached background.
+        """
+        if self.artist is None:
+            return
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self.artist.axes.draw_artist(self.artist)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def stop(self):
+        """
+        Ends the move: the artist becomes part of normal draws again.
+        """
+        if self.artist is not None:
+            self.artist.set_animated(False)
+        if self._cid is not None:
+            self.canvas.mpl_disconnect(self._cid)
+        self.artist = None
+        self._background = None
+        self._cid = None
+        self.canvas.draw_idle()
+
+    def _on_draw(self, event):
+        """
+        Re-caches the background after any full draw (e.g. a resize) during a move.
+        """
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        if self.artist is not None:
+            self.artist.axes.draw_artist(self.artist)
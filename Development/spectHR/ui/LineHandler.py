@@ -1,67 +1,82 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
 from spectHR.Tools.Logger import logger
+from spectHR.ui.Blitter import Blitter
 
 class DraggableVLine:
     """
     A draggable vertical line on a plot.
-    
+
+    This is a standalone line with its own event handlers; the R-tops in `prepPlot` are
+    handled by `LineHandler`, which draws all of them as one collection. Call `disconnect`
+    when the line is no longer needed, so its callbacks do not stay registered.
+
     Attributes:
         line (matplotlib.lines.Line2D): The line object representing the vertical line.
     """
     active_line = None  # Shared among all instances
     mode = 'Drag'
     line = None
-    
-    def __init__(self, ax, x_position, callback_drag=None, callback_remove=None, color = 'red'):
+
+    def __init__(self, ax, x_position, callback_drag=None, callback_remove=None, color = 'red', blitter=None):
         """
         Initializes DraggableVLine at a specified x position.
-        
+
         Args:
             ax (matplotlib.axes.Axes): The axes to place the vertical line on.
             x_position (float): The initial x-coordinate for the line.
             callback_drag (callable, optional): Callback for when the line is dragged.
+            blitter (Blitter, optional): Shared blitter of the figure; one is created if omitted.
         """
         self.ax = ax
         self.line = self.ax.axvline(x=x_position, color=color, lw=.8, linestyle='-', picker=True, pickradius = 10,  alpha = .5)
         self.callback_drag = callback_drag
         self.callback_remove = callback_remove
         self.press = None
+        self.blitter = blitter if blitter is not None else Blitter(ax.figure.canvas)
+        self.cids = []
         self.connect(ax.figure)
 
     def on_press(self, event):
         """
         Captures the initial click location if near the line.
-        
+
         Args:
             event (matplotlib.backend_bases.Event): The mouse press event.
         """
         if (DraggableVLine.mode == 'Drag') or (DraggableVLine.mode == 'Remove'):
             if (DraggableVLine.active_line is None) and (self.line.contains(event)[0]):
                 DraggableVLine.active_line = self.line
-                self.press = self.line.get_xdata()[0]      
+                self.press = self.line.get_xdata()[0]
                 logger.info(f'setting active line to line at {self.press}')
+                if DraggableVLine.mode == 'Drag':
+                    # Only this line moves: cache the rest of the figure and blit the line
+                    self.blitter.start(self.line)
 
 
     def on_drag(self, event):
         """
         Drags the line to follow the mouse's x position.
-        
+
         Args:
             event (matplotlib.backend_bases.Event): The mouse drag event.
         """
-        if DraggableVLine.mode == 'Drag':  
+        if DraggableVLine.mode == 'Drag':
             if DraggableVLine.active_line is self.line:
                 self.line.set_xdata([event.xdata, event.xdata])
-                self.ax.figure.canvas.draw_idle()
+                self.blitter.update()
 
     def on_release(self, event):
         """
         Releases the drag operation. Call the drag_callback with the new_x value
-        
+
         Args:
             event (matplotlib.backend_bases.Event): The mouse release event.
         """
+        if self.blitter.artist is self.line:
+            self.blitter.stop()
+
         if (DraggableVLine.mode != 'Drag' \
             and DraggableVLine.mode != 'Remove') \
                 or self.press is None \
@@ -69,98 +84,301 @@ class DraggableVLine:
             return
 
         # Callback with updated x-position if set
-        if DraggableVLine.mode == 'Drag' \
-              or self.press is None \
-                and self.callback_drag:
+        if DraggableVLine.mode == 'Drag' and self.callback_drag:
             self.callback_drag(self.press, event.xdata)
 
-            
-        if DraggableVLine.mode == 'Remove' \
-             or self.press is None \
-                and self.callback_remove:
+        if DraggableVLine.mode == 'Remove' and self.callback_remove:
             self.callback_remove(self.press, event.xdata)
             logger.info(f'release line at {self.press}')
             DraggableVLine.active_line = None
             self.line.remove()
-        
+            self.disconnect()
+
         self.press = None
         DraggableVLine.active_line = None
 
-            
+
     def connect(self, fig):
         """
         Connects events for dragging the line.
-        
+
         Args:
             fig (matplotlib.figure.Figure): The figure in which to capture events.
         """
-        fig.canvas.mpl_connect('button_press_event', self.on_press)
-        fig.canvas.mpl_connect('motion_notify_event', self.on_drag)
-        fig.canvas.mpl_connect('button_release_event', self.on_release)
+        self.cids = [
+            fig.canvas.mpl_connect('button_press_event', self.on_press),
+            fig.canvas.mpl_connect('motion_notify_event', self.on_drag),
+            fig.canvas.mpl_connect('button_release_event', self.on_release),
+        ]
+
+    def disconnect(self):
+        """
+        Disconnects the event callbacks of the line.
+        """
+        for cid in self.cids:
+            self.ax.figure.canvas.mpl_disconnect(cid)
+        self.cids = []
+
 
 class LineHandler:
     """
-    Manages draggable lines on a plot, allowing add, remove, and drag operations.
-    
+    Draws the R-tops of a view as one collection and handles add, remove and drag on it.
+
+    All R-top lines are segments of a single `LineCollection` (x in data, y in axes
+    coordinates). The IBI arrows between successive R-tops are one more collection plus
+    two marker lines for the heads, and the IBI labels come from a pool of reused text
+    artists. Drawing thousands of beats therefore costs a handful of artists.
+
+    The handler connects one set of mouse callbacks to the figure, once. A press is
+    hit-tested with `searchsorted` on the sorted R-top times, within `pickradius` pixels.
+    While a line is dragged it is taken out of the collection and blitted as a single
+    animated line (see `Blitter`).
+
     Attributes:
-        draggable_lines (set): A set of DraggableVLine objects on the plot.
-        callback_add (callable): Function to call when a line is added.
-        callback_remove (callable): Function to call when a line is removed.
+        times (np.ndarray): Sorted times of the R-tops in view.
+        callback_drag (callable): Called as callback_drag(old_x, new_x) after a drag.
+        callback_remove (callable): Called as callback_remove(old_x, new_x) on removal.
     """
-    
+    mode = 'Drag'
+    pickradius = 10  # pixels
+
     def __init__(self, ax, callback_remove=None, callback_drag=None):
         """
-        Initializes LineHandler with an empty set of draggable lines and optional callbacks.
-        
+        Initializes LineHandler with an empty set of lines and optional callbacks.
+
         Args:
-            callback_add (callable, optional): Callback for when a line is added.
+            ax (matplotlib.axes.Axes): The axes on which the R-tops are drawn.
             callback_remove (callable, optional): Callback for when a line is removed.
             callback_drag (callable, optional): Callback for when a line is dragged.
         """
         self.ax = ax
-        self.draggable_lines = []
         self.callback_remove = callback_remove
         self.callback_drag = callback_drag
+        self.blitter = Blitter(ax.figure.canvas)
+        self.times = np.empty(0)
+        self.colors = np.empty((0, 4))
+        self.active = None  # index of the line being dragged or removed
+        self.press = None
+        self.lines = None
+        self.arrows = None
+        self.heads = None
+        self.labels = []
+        self.drag_line = None
+        self.mode = 'Drag'
         DraggableVLine.mode = 'Drag'
-        
+
+        canvas = ax.figure.canvas
+        self.cids = [
+            canvas.mpl_connect('button_press_event', self.on_press),
+            canvas.mpl_connect('motion_notify_event', self.on_drag),
+            canvas.mpl_connect('button_release_event', self.on_release),
+        ]
+
+    def _artists(self):
+        """
+        (Re)creates the collections when they are not on the axes (e.g. after `ax.clear()`).
+        """
+        if self.lines is None or self.lines.axes is not self.ax:
+            self.lines = LineCollection([], linewidths=.8, alpha=.5, transform=self.ax.get_xaxis_transform())
+            self.ax.add_collection(self.lines, autolim=False)
+        if self.arrows is None or self.arrows.axes is not self.ax:
+            self.arrows = LineCollection([], colors='blue', linewidths=.5)
+            self.ax.add_collection(self.arrows, autolim=False)
+            self.heads = (self.ax.plot([], [], '<', color='blue', markersize=2.5, scalex=False, scaley=False)[0],
+                          self.ax.plot([], [], '>', color='blue', markersize=2.5, scalex=False, scaley=False)[0])
+            self.labels = []
+
+    def set_lines(self, times, colors='red', ibis=None, height=None):
+        """
+        Replaces the R-tops in view.
+
+        Args:
+            times (array-like): R-top times.
+            colors (color or list of colors, optional): One color, or one per R-top.
+            ibis (array-like, optional): IBI (s) per R-top; draws the arrows and labels.
+            height (float, optional): Data y-coordinate of the arrows and labels.
+        """
+        self._artists()
+        times = np.asarray(times, dtype=float)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        rgba = to_rgba_array(colors)
+        self.colors = np.broadcast_to(rgba, (len(times), 4))[order] if len(rgba) == 1 else rgba[order]
+        self._draw_lines()
+
+        if ibis is None or height is None:
+            self._draw_intervals(np.empty(0), np.empty(0), 0)
+        else:
+            self._draw_intervals(self.times, np.asarray(ibis, dtype=float)[order], height)
+
+    def _draw_lines(self, skip=None):
+        """
+        Pushes the line segments to the collection, optionally without line `skip`.
+        """
+        keep = np.ones(len(self.times), dtype=bool)
+        if skip is not None:
+            keep[skip] = False
+        x = self.times[keep]
+        self.lines.set_segments(np.stack((np.column_stack((x, np.zeros_like(x))),
+                                          np.column_stack((x, np.ones_like(x)))), axis=1))
+        self.lines.set_colors(self.colors[keep])
+
+    def _draw_intervals(self, times, ibis, height):
+        """
+        Draws the IBI arrows and (when there is room for them) the IBI labels.
+        """
+        valid = np.isfinite(ibis) & (ibis != 0)
+        ibis = ibis[valid]
+        start, end = times[valid], times[valid] + ibis
+        y = np.full_like(start, height)
+        self.arrows.set_segments(np.stack((np.column_stack((start, y)), np.column_stack((end, y))), axis=1))
+        self.heads[0].set_data(start, y)
+        self.heads[1].set_data(end, y)
+
+        # Labels only when the beats are far enough apart to read them (> 25 pixels)
+        x0, x1 = self.ax.get_xlim()
+        pixels = self.ax.get_window_extent().width
+        readable = len(start) and np.median(ibis) * pixels / max(x1 - x0, 1e-9) > 25
+        count = len(start) if readable else 0
+        while len(self.labels) < count:
+            self.labels.append(self.ax.text(
+                0, 0, '', fontsize=6, rotation=0,
+                horizontalalignment="center", verticalalignment="bottom", color="blue",
+                bbox=dict(facecolor=self.ax.get_facecolor(), edgecolor=self.ax.get_facecolor(), alpha=0.4),
+            ))
+        for i, label in enumerate(self.labels):
+            if i < count:
+                label.set_position((start[i] + 0.5 * ibis[i], height))
+                label.set_text(f"{1000 * ibis[i]:.0f}")
+            label.set_visible(i < count)
+
     def add_line(self, x_position, color='red'):
         """
-        Adds a draggable line at the specified x position without plotting it.
-        
+        Adds a line at the specified x position.
+
         Args:
-            ax (matplotlib.axes.Axes): The axes on which to add the line.
             x_position (float): The x-coordinate for the new line.
+            color (color, optional): Line color. Defaults to 'red'.
         """
-        self.draggable_lines.append(DraggableVLine(self.ax, x_position, self.callback_drag, self.callback_remove, color=color))
+        self._artists()
+        index = np.searchsorted(self.times, x_position)
+        self.times = np.insert(self.times, index, x_position)
+        self.colors = np.insert(self.colors, index, to_rgba_array(color)[0], axis=0)
+        self._draw_lines()
 
-        
-    def remove_line(self, line):
+    def remove_line(self, x_position):
         """
-        Removes a specified line from the set of draggable lines.
-        
+        Removes the line closest to the specified x position.
+
         Args:
-            line (DraggableVLine): The line object to be removed.
+            x_position (float): The x-coordinate of the line to remove.
         """
-        if line in self.draggable_lines:
-            line.line.remove()  # Remove line from the plot
-            self.draggable_lines.discard(line)
-            plt.draw()
-            
-            if self.callback_remove:
-                self.callback_remove(line)
-    
+        if len(self.times) == 0:
+            return
+        index = self.hit(x_position)
+        if index is None:
+            index = int(np.argmin(np.abs(self.times - x_position)))
+        old_x = self.times[index]
+        self.times = np.delete(self.times, index)
+        self.colors = np.delete(self.colors, index, axis=0)
+        self._draw_lines()
+        self.ax.figure.canvas.draw_idle()
+        if self.callback_remove:
+            self.callback_remove(old_x, old_x)
+
     def clear(self):
         """
-        Removes all draggable lines from the Axes and clears the `draggable_lines` list.
+        Removes all lines, arrows and labels from the view.
+        """
+        self.set_lines([])
+
+    def disconnect(self):
+        """
+        Disconnects the mouse callbacks of the handler.
+        """
+        for cid in self.cids:
+            self.ax.figure.canvas.mpl_disconnect(cid)
+        self.cids = []
+
+    def hit(self, x):
+        """
+        Index of the line within `pickradius` pixels of data coordinate x, or None.
+
+        Args:
+            x (float): The x-coordinate (data) of the mouse.
+        """
+        if len(self.times) == 0:
+            return None
+        i = np.searchsorted(self.times, x)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.times)]
+        nearest = min(candidates, key=lambda j: abs(self.times[j] - x))
+        to_pixels = self.ax.transData.transform
+        distance = abs(to_pixels((self.times[nearest], 0))[0] - to_pixels((x, 0))[0])
+        return nearest if distance <= self.pickradius else None
+
+    def on_press(self, event):
         """
-        for draggable_line in self.draggable_lines:
-            line = draggable_line.line
-            if line.axes:  # Check if the line is still associated with an Axes
-                line.remove()  # Remove the line from the plot
-        self.draggable_lines.clear()  # Clear the internal list of draggable lines
-        plt.draw()  # Redraw the canvas
-   
+        Selects the line under the mouse (Drag and Remove modes); a drag starts blitting.
+        """
+        if self.mode not in ('Drag', 'Remove') or event.inaxes is not self.ax or event.xdata is None:
+            return
+        self.active = self.hit(event.xdata)
+        if self.active is None:
+            return
+        self.press = self.times[self.active]
+        logger.info(f'setting active line to line at {self.press}')
+        if self.mode == 'Drag':
+            # Take the line out of the collection and blit it as a single animated line
+            if self.drag_line is None or self.drag_line.axes is not self.ax:
+                self.drag_line = self.ax.axvline(x=self.press, lw=.8, alpha=.5)
+            self.drag_line.set_xdata([self.press, self.press])
+            self.drag_line.set_color(self.colors[self.active])
+            self.drag_line.set_visible(True)
+            self._draw_lines(skip=self.active)
+            self.blitter.start(self.drag_line)
+
+    def on_drag(self, event):
+        """
+        Moves the dragged line with the mouse, redrawing only that line.
+        """
+        if self.mode == 'Drag' and self.active is not None and event.xdata is not None:
+            self.drag_line.set_xdata([event.xdata, event.xdata])
+            self.blitter.update()
+
+    def on_release(self, event):
+        """
+        Finishes a drag or removal and reports it through the callbacks.
+        """
+        if self.active is None:
+            return
+        if self.blitter.artist is self.drag_line:
+            self.blitter.stop()
+            self.drag_line.set_visible(False)
+        old_x, index = self.press, self.active
+        self.active, self.press = None, None
+
+        if event.inaxes is not self.ax or event.xdata is None:
+            self._draw_lines()  # cancelled: put the line back
+            self.ax.figure.canvas.draw_idle()
+            return
+
+        if self.mode == 'Drag':
+            self.times[index] = event.xdata
+            order = np.argsort(self.times, kind='stable')
+            self.times, self.colors = self.times[order], self.colors[order]
+            self._draw_lines()
+            if self.callback_drag:
+                self.callback_drag(old_x, event.xdata)
+        elif self.mode == 'Remove':
+            logger.info(f'release line at {old_x}')
+            self.times = np.delete(self.times, index)
+            self.colors = np.delete(self.colors, index, axis=0)
+            self._draw_lines()
+            if self.callback_remove:
+                self.callback_remove(old_x, event.xdata)
+        self.ax.figure.canvas.draw_idle()
+
     def update_mode(self, mode):
         logger.info(f'Changed mode to {mode}')
+        self.mode = mode
         DraggableVLine.mode = mode
-
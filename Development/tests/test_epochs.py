@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from spectHR import SpectHRDataset, TimeSeries
+from spectHR.Tools.Explode import MAX_EPOCHS, epoch_bit
+
+
+def make_dataset(n_epochs, fs=130):
+    """
+    A dataset with a flat 10-minute ECG and n_epochs consecutive 5-second epochs.
+    """
+    t = np.arange(0, 600, 1 / fs)
+    dataset = SpectHRDataset.__new__(SpectHRDataset)
+    dataset.ecg = TimeSeries(t, np.zeros(len(t)), fs)
+    labels, times = [], []
+    for i in range(n_epochs):
+        labels += [f'start e{i}', f'end e{i}']
+        times += [5.0 * i + 0.5, 5.0 * i + 4.5]
+    dataset.events = pd.DataFrame({'time': times, 'label': labels})
+    return dataset
+
+
+def test_more_epochs_than_mask_bits_are_ignored():
+    dataset = make_dataset(MAX_EPOCHS + 6)
+    dataset.create_epoch_series()
+
+    assert dataset.epoch_names == [f'e{i}' for i in range(MAX_EPOCHS)]
+    assert dataset.unique_epochs == set(dataset.epoch_names)
+
+    time = dataset.ecg.time.to_numpy()
+    for i in (0, 1, MAX_EPOCHS - 1):
+        inside = (time >= 5.0 * i + 0.5) & (time <= 5.0 * i + 4.5)
+        assert np.all(dataset.epoch_mask[inside] == epoch_bit(i))
+        assert all(epochs == [f'e{i}'] for epochs in dataset.epoch[inside])
+
+    # Samples of the ignored epochs belong to no epoch
+    ignored = time >= 5.0 * MAX_EPOCHS
+    assert not dataset.epoch_mask[ignored].any()
+    assert all(epochs == [] for epochs in dataset.epoch[ignored])
+
+
+def test_no_events():
+    dataset = make_dataset(0)
+    dataset.events = None
+    dataset.create_epoch_series()
+    assert not hasattr(dataset, 'epoch_names')
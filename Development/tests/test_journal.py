@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from spectHR import SpectHRDataset, TimeSeries, borderData
+from spectHR.DataSet.EditJournal import HEADER, RECORD
+
+
+def saved_dataset(tmp_path, fs=130):
+    """
+    Saves a 5-minute dataset with one epoch and regular beats in tmp_path, and returns the
+    filename to load it from.
+    """
+    filename = str(tmp_path / 'recording.xdf')
+    dataset = SpectHRDataset(filename)  # the file does not exist: only the paths are set
+    t = np.arange(0, 300, 1 / fs)
+    dataset.ecg = TimeSeries(t, np.zeros(len(t)), fs)
+    dataset.events = pd.DataFrame({'time': [10.0, 290.0], 'label': ['start rest', 'end rest']})
+    dataset.create_epoch_series()
+    beats = np.arange(0.5, 299, 0.8)
+    dataset.RTops = pd.DataFrame({'time': beats, 'epoch': [['rest']] * len(beats),
+                                  'ibi': np.append(np.diff(beats), np.nan), 'ID': 'N'})
+    dataset.save()
+    return filename
+
+
+def test_copied_dataset_keeps_journaling(tmp_path):
+    filename = saved_dataset(tmp_path)
+    dataset = SpectHRDataset(filename)
+    n_beats = len(dataset.RTops)
+    dataset.rtop_model.remove(10)
+
+    # Actions such as borderData work on a deep copy of the dataset
+    dataset = borderData(dataset)
+    assert dataset.journal.can_undo()
+    dataset.rtop_model.remove(20)
+
+    journal_path = dataset.journal_path
+    assert dataset.journal.path == journal_path
+    assert os.path.getsize(journal_path) == HEADER.size + 2 * RECORD.itemsize
+
+    # Both edits survive a restart without a save
+    assert len(SpectHRDataset(filename).RTops) == n_beats - 2
+
+
+def test_journal_stops_when_another_copy_wrote(tmp_path):
+    filename = saved_dataset(tmp_path)
+    dataset = SpectHRDataset(filename)
+    copy = borderData(dataset)
+    copy.rtop_model.remove(20)
+
+    # The original no longer matches the file: it stops journaling and compacts on save
+    dataset.rtop_model.remove(10)
+    assert dataset.journal.path is None
+    dataset.save()
+    assert len(SpectHRDataset(filename).RTops) == len(dataset.RTops)
+
+
+def test_in_place_change_is_saved(tmp_path):
+    filename = saved_dataset(tmp_path)
+    dataset = SpectHRDataset(filename)
+    dataset.RTops.at[10, 'ID'] = 'L'
+    dataset.rtops_changed()
+    dataset.save()
+
+    assert SpectHRDataset(filename).RTops.at[10, 'ID'] == 'L'